@@ -1,17 +1,39 @@
 import aiohttp
-import aiofiles
 import asyncio
 from bs4 import BeautifulSoup
-import csv
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+import json
 import os
-from PyQt5.QtWidgets import QApplication
+import re
+from dataclasses import dataclass
 from MeSH.meshData_func import frenchTitleToUniqueID, frenchTitleToMesh
-import datetime
+from common.output_sink import open_sink, load_known_urls
+from common.http_cache import cached_get
+from common.progress import ProgressTracker, ProgressReporter
 
-nb_tasks = 0
-nb_tasks_done = 0
-nb_tasks_failed = 0
-timeStart = 0
+@dataclass
+class LissaRecord:
+    """
+    A document returned by the LiSSa query API.
+
+    Attributes:
+    doc_id (str): The LiSSa document identifier.
+    title (str): The title of the document.
+    url (str): The URL of the document page.
+    abstract (str): The abstract if the API already returned it, None otherwise.
+    """
+    doc_id: str
+    title: str
+    url: str
+    abstract: str = None
+
+RESULT_LINK = re.compile(r'<a\b[^>]*class="nounderline"[^>]*>.*?</a>', re.S)
+HREF = re.compile(r'href="([^"]*)"')
+TAG = re.compile(r'<[^>]+>')
+ABSTRACT_KEYS = ('abstract', 'resume', 'résumé', 'summary')
 
 def is_french(text):
     """
@@ -37,9 +59,97 @@ def is_french(text):
     else:
         return False
 
+def strip_tags(fragment):
+    """
+    Removes the HTML tags of a fragment and collapses its whitespace.
+
+    Parameters:
+    fragment (str): The HTML fragment.
+
+    Returns:
+    str: The text of the fragment.
+    """
+    return " ".join(TAG.sub(" ", fragment).split())
+
+def records_from_fragment(fragment, abstract=None):
+    """
+    Extracts the result links of an HTML fragment of the LiSSa query API.
+
+    Parameters:
+    fragment (str): The HTML fragment, already unescaped by the JSON decoder.
+    abstract (str): The abstract carried next to the fragment, if any.
+
+    Returns:
+    List[LissaRecord]: The records found in the fragment.
+    """
+    records = []
+    for link in RESULT_LINK.findall(fragment):
+        href = HREF.search(link)
+        if href is None:
+            continue
+        href = href.group(1).strip('/')
+        doc_id = re.split(r'[/=]', href)[-1]
+        records.append(LissaRecord(doc_id, strip_tags(link), 'https://www.lissa.fr/' + href, abstract))
+    return records
+
+def records_from_payload(node):
+    """
+    Walks a decoded LiSSa query API payload and collects the documents it holds.
+
+    The API answers with JSON whose string fields hold HTML fragments. When a
+    JSON object holds, across all of its fields, exactly one result link, that
+    record inherits the abstract stored next to it in the object. When the
+    object holds several records, the abstract cannot be told apart between
+    them, so none of them inherits it and their abstract stays None.
+
+    Parameters:
+    node (dict | list | str): The decoded payload, or a part of it.
+
+    Returns:
+    List[LissaRecord]: The records found in the payload.
+    """
+    records = []
+    if isinstance(node, dict):
+        abstract = None
+        for key, value in node.items():
+            if key.lower() in ABSTRACT_KEYS and isinstance(value, str) and strip_tags(value) != "":
+                abstract = strip_tags(value)
+        for value in node.values():
+            records += records_from_payload(value)
+        if len(records) == 1 and records[0].abstract is None:
+            records[0].abstract = abstract
+    elif isinstance(node, list):
+        for value in node:
+            records += records_from_payload(value)
+    elif isinstance(node, str) and 'nounderline' in node:
+        records += records_from_fragment(node)
+    return records
+
+def parse_lissa_response(content):
+    """
+    Parses the response of the LiSSa query API into records.
+
+    Falls back to scanning the raw text when the response is not valid JSON.
+
+    Parameters:
+    content (str): The body of the response.
+
+    Returns:
+    List[LissaRecord]: The records of the search, without duplicates.
+    """
+    try:
+        records = records_from_payload(json.loads(content))
+    except ValueError:
+        records = records_from_fragment(content.replace('\\"', '"'))
+    unique_records = {}
+    for record in records:
+        if record.url not in unique_records or unique_records[record.url].abstract is None:
+            unique_records[record.url] = record
+    return list(unique_records.values())
+
 async def search_lissa(session, query, page, nb_data_pages):
     """
-    Searches LiSSa and retrieves URLs of the search results.
+    Searches LiSSa and retrieves the documents of the search results.
 
     Parameters:
     session (aiohttp.ClientSession): The session to use for making the request.
@@ -48,103 +158,213 @@ async def search_lissa(session, query, page, nb_data_pages):
     nb_data_pages (int): The number of data pages to retrieve.
 
     Returns:
-    List[str]: A list of URLs of the search results.
+    List[LissaRecord]: The documents of the search results.
     """
     search_url = f'https://www.lissa.fr/dc/api/dc/query?q={query}&p={page}&n={nb_data_pages}&t=NLM&f=true.speps&l=fr&s=MAJOR%3D4%2CMINOR%3D1%2CET_MAN%3D3%2CET_AUTO%3D1%2CNOEXPL%3D3%2CEXPL%3D1%2CAFF%3D0.0%2CYEAR_CURRENT%3D10%2CYEAR_STEP%3D0.6%2CTITLE%3D10%2CSUBTITLE%3D10%2CKEYWORDS_LIST%3D5%2CINDEX_MESH_PUBLICATION_TYPE'+'{MSH_D_016454%3D3%2CMSH_D_017065%3D3%2CMSH_D_016446%3D3%2CMSH_D_016431%3D3%2CMSH_D_017418%3D3}'
-    async with session.get(search_url) as response:
-        if response.status == 200:
-            content = await response.text()
-            soup = BeautifulSoup(content, 'html.parser')
-            result_links = soup.find_all('a', class_='\\"nounderline\\"')
-            urls = ['https://www.lissa.fr/' + link['href'][2:-2] for link in result_links]
-            return urls
-        else:
-            print(f"Erreur lors de la recherche : {response.status}")
-            return []
+    response = await cached_get(session, search_url, source='lissa')
+    if response.status == 200:
+        return parse_lissa_response(response.text)
+    else:
+        print(f"Erreur lors de la recherche : {response.status}")
+        return []
+
+def parse_article_page_soup(content):
+    """
+    Extracts the title and summary of a LiSSa article page with a full BeautifulSoup tree.
+
+    Parameters:
+    content (str): The HTML of the article page.
 
-async def extract_article_data(session, url, query, meshTree, writer, progress_bar, lissa_progress_label):
+    Returns:
+    tuple: The title and the summary of the article.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    title_tag = soup.find('h2')  
+    title = title_tag.text.strip() if title_tag else 'Titre non trouvé'
+    
+    section_title_tag = soup.find_all('section-title')
+    section_text_tag = soup.find_all('simple-para')
+    summary = []
+    for i in range(len(section_title_tag)):
+        try:
+            summary.append(section_title_tag[i].text+" : "+ section_text_tag[i].text)
+        except:
+            pass
+
+    summary = " ".join(summary) if len(summary) > 0 else 'Résumé non trouvé'
+    return title, summary
+
+def parse_article_page_lxml(content):
     """
-    Extracts the title and summary of an article given its URL.
+    Extracts the title and summary of a LiSSa article page, only visiting the
+    <h2>, <section-title> and <simple-para> elements with lxml XPath queries.
+
+    Parameters:
+    content (str): The HTML of the article page.
+
+    Returns:
+    tuple: The title and the summary of the article.
+    """
+    tree = lxml.html.fromstring(content)
+
+    title_tag = tree.xpath('(//h2)[1]')
+    title = title_tag[0].text_content().strip() if title_tag else 'Titre non trouvé'
+
+    section_titles = [tag.text_content() for tag in tree.xpath('//section-title')]
+    section_texts = [tag.text_content() for tag in tree.xpath('//simple-para')]
+    summary = [section_title+" : "+section_text for section_title, section_text in zip(section_titles, section_texts)]
+
+    summary = " ".join(summary) if len(summary) > 0 else 'Résumé non trouvé'
+    return title, summary
+
+def parse_article_page(content):
+    """
+    Extracts the title and summary of a LiSSa article page.
+
+    Uses the lxml path and falls back to BeautifulSoup when lxml is not
+    installed or cannot parse the page.
+
+    Parameters:
+    content (str): The HTML of the article page.
+
+    Returns:
+    tuple: The title and the summary of the article.
+    """
+    if lxml is not None:
+        try:
+            return parse_article_page_lxml(content)
+        except Exception:
+            pass
+    return parse_article_page_soup(content)
+
+async def extract_article_data(session, record, queries, meshTree, writer, progress):
+    """
+    Extracts the title and summary of an article and saves it.
+
+    The article page is only fetched when the search response did not already
+    carry the abstract of the document.
 
     Parameters:
     session (aiohttp.ClientSession): The session to use for making the request.
-    url (str): The URL of the article.
-    query (str): The search query used.
+    record (LissaRecord): The document returned by the search.
+    queries (list): The search queries that returned the document.
     meshTree (list): The mesh data to use for finding mesh terms.
-    writer (csv.writer): The CSV writer to write the results.
-    progress_bar (QProgressBar): The progress bar to update.
-    lissa_progress_label (QLabel): The progress label to update.
+    writer: The output sink to write the results.
+    progress (ProgressTracker): The progress of the run.
 
     Returns:
     None
     """
-    global nb_tasks
-    global nb_tasks_done
-    global nb_tasks_failed
-    async with session.get(url) as response:
-        if response.status == 200:
-            content = await response.text()
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            title_tag = soup.find('h2')  
-            title = title_tag.text.strip() if title_tag else 'Titre non trouvé'
-            
-            section_title_tag = soup.find_all('section-title')
-            section_text_tag = soup.find_all('simple-para')
-            summary = []
-            for i in range(len(section_title_tag)):
-                try:
-                    summary.append(section_title_tag[i].text+" : "+ section_text_tag[i].text)
-                except:
-                    pass
-
-            summary = " ".join(summary) if len(summary) > 0 else 'Résumé non trouvé'
-
-            article_data = {'url': url, 'title': title, 'summary': summary}
-            
-            QApplication.processEvents()
-            if article_data['summary'] != 'Résumé non trouvé' and is_french(article_data['summary']):
-                await writer.writerow([article_data['url'], ";".join(frenchTitleToMesh([query], meshTree)), ";".join(frenchTitleToUniqueID([query], meshTree)), article_data['title'], article_data['summary']])
-                update_progress_bar(progress_bar, lissa_progress_label, 1, 0)    
-            else:
-                update_progress_bar(progress_bar, lissa_progress_label, 0, 1)
-                print("!!!!!!!!!!! Pas de résumé ou en anglais !!!!!!!!!!!")
-                print(article_data['url'])
-        else:
-            update_progress_bar(progress_bar, lissa_progress_label, 0, 1)
-            print(f"Erreur lors de la récupération de l'article : {response.status}")
-            return {'title': 'Erreur', 'summary': 'Erreur'}
-
-def update_progress_bar(progress_bar, lissa_progress_label, nbIdDone, nbIdFailed):
-    """
-    Updates the progress bar and label for the LiSSa request process.
+    if record.abstract is not None:
+        article_data = {'url': record.url, 'title': record.title, 'summary': record.abstract}
+        await save_article(article_data, queries, meshTree, writer, progress)
+        return
+
+    url = record.url
+    response = await cached_get(session, url, source='lissa')
+    if response.status == 200:
+        title, summary = parse_article_page(response.text)
+
+        article_data = {'url': url, 'title': title, 'summary': summary}
+        await save_article(article_data, queries, meshTree, writer, progress)
+    else:
+        progress.advance(failed=1)
+        print(f"Erreur lors de la récupération de l'article : {response.status}")
+        return {'title': 'Erreur', 'summary': 'Erreur'}
+
+async def save_article(article_data, queries, meshTree, writer, progress):
+    """
+    Writes an article to the CSV file if its summary is available and in French.
 
     Parameters:
-    progress_bar (QProgressBar): The progress bar to update.
-    lissa_progress_label (QLabel): The label to display progress text.
-    nbIdDone (int): The number of IDs done.
-    nbIdFailed (int): The number of IDs failed.
+    article_data (dict): The url, title and summary of the article.
+    queries (list): The search queries that returned the article, used to tag the row.
+    meshTree (list): The mesh data to use for finding mesh terms.
+    writer: The output sink to write the results.
+    progress (ProgressTracker): The progress of the run.
 
     Returns:
     None
     """
-    global nb_tasks
-    global nb_tasks_done
-    global nb_tasks_failed
-
-    a_timedelta = datetime.datetime.now() - timeStart
-    seconds = a_timedelta.total_seconds()
-    nb_tasks_done += nbIdDone
-    nb_tasks_failed += nbIdFailed
-    if (nb_tasks-nb_tasks_failed) != 0:
-        progress_bar.setValue(int(nb_tasks_done/(nb_tasks-nb_tasks_failed)*100))
-        lissa_progress_label.setText(f"LISSA {int(nb_tasks_done/(nb_tasks-nb_tasks_failed)*100)}% ({nb_tasks_done}/{nb_tasks-nb_tasks_failed}) {int(seconds / 60)}m {int(seconds % 60)}s")
+    if article_data['summary'] != 'Résumé non trouvé' and is_french(article_data['summary']):
+        await writer.writerow([article_data['url'], ";".join(frenchTitleToMesh(queries, meshTree)), ";".join(frenchTitleToUniqueID(queries, meshTree)), article_data['title'], article_data['summary']])
+        progress.advance(done=1)
     else:
-        progress_bar.setValue(0)
-        lissa_progress_label.setText(f"LISSA 0% (0/0) {int(seconds / 60)}m {int(seconds % 60)}s")
-    QApplication.processEvents()
+        progress.advance(failed=1)
+        print("!!!!!!!!!!! Pas de résumé ou en anglais !!!!!!!!!!!")
+        print(article_data['url'])
+
+async def bounded(semaphore, coroutine):
+    """
+    Awaits a coroutine once the semaphore allows it.
+
+    Parameters:
+    semaphore (asyncio.Semaphore): The semaphore capping the concurrent requests.
+    coroutine (coroutine): The coroutine to await.
+
+    Returns:
+    The result of the coroutine.
+    """
+    async with semaphore:
+        return await coroutine
 
-async def LiSSaReq(query, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, nb__tasks=1, nb__tasks_done=0, max_concurrent_requests=5):
+async def LiSSaReqMulti(queries, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType="w", max_concurrent_requests=5, sink='csv'):
+    """
+    Searches LiSSa for several queries at once and saves the results in a single file.
+
+    All the searches share one session and one writer. A document returned by
+    several queries is fetched and written once, tagged with the MeSH codes and
+    unique IDs of all of them. In append mode, the documents already saved in
+    the file are skipped before being fetched.
+
+    Parameters:
+    queries (list): The search queries.
+    filename (str): The name of the file to save the results.
+    nb_pages (int): The number of pages to search for each query.
+    nb_data_pages (int): The number of data pages to retrieve.
+    meshTree (list): The mesh data to use for finding mesh terms.
+    progress_bar (QProgressBar): The progress bar to update.
+    lissa_progress_label (QLabel): The progress label to update.
+    openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+    max_concurrent_requests (int): The maximum number of concurrent requests for the whole run.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
+
+    Returns:
+    None
+    """
+    progress = ProgressTracker('LISSA', len(queries) * nb_pages * nb_data_pages)
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    connector = aiohttp.TCPConnector(limit_per_host=max_concurrent_requests)
+    async with aiohttp.ClientSession(connector=connector) as session, ProgressReporter(progress, progress_bar, lissa_progress_label):
+        if not os.path.exists('LiSSa/LiSSa_data/'):
+            os.makedirs('LiSSa/LiSSa_data/')
+        file_path = f'LiSSa/LiSSa_data/{filename}_lissa_fr'
+        known_urls = load_known_urls(sink, file_path, openType)
+        async with open_sink(sink, file_path, openType) as writer:
+            searches = [(query, page) for query in queries for page in range(1, nb_pages+1)]
+            results = await asyncio.gather(*[bounded(semaphore, search_lissa(session, query, page, nb_data_pages)) for query, page in searches])
+
+            documents = {}
+            for (query, page), records in zip(searches, results):
+                progress.advance(failed=nb_data_pages-len(records))
+                for record in records:
+                    if known_urls.skip(record.url):
+                        progress.advance(skipped=1)
+                    elif record.url in documents:
+                        # Already fetched for another query, only the tag is added
+                        documents[record.url][1].append(query)
+                        progress.advance(skipped=1)
+                    else:
+                        documents[record.url] = (record, [query])
+
+            if known_urls.skipped > 0:
+                print(f"{known_urls.skipped} document(s) already saved in {file_path} skipped")
+
+            tasks = [bounded(semaphore, extract_article_data(session, record, document_queries, meshTree, writer, progress)) for record, document_queries in documents.values()]
+            await asyncio.gather(*tasks)
+
+async def LiSSaReq(query, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType="w", max_concurrent_requests=5, sink='csv'):
     """
     Searches LiSSa and retrieves data based on the search query.
 
@@ -156,30 +376,26 @@ async def LiSSaReq(query, filename, nb_pages, nb_data_pages, meshTree, progress_
     meshTree (list): The mesh data to use for finding mesh terms.
     progress_bar (QProgressBar): The progress bar to update.
     lissa_progress_label (QLabel): The progress label to update.
-    nb__tasks (int): The total number of tasks.
-    nb__tasks_done (int): The number of tasks done.
+    openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
     max_concurrent_requests (int): The maximum number of concurrent requests.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     None
     """
-    global nb_tasks
-    global nb_tasks_done
-    global nb_tasks_failed
-    global timeStart
-    if nb__tasks_done == 0:
-        nb_tasks_failed = 0
-        timeStart = datetime.datetime.now()
-    nb_tasks = nb__tasks * nb_pages * nb_data_pages
-    nb_tasks_done = nb__tasks_done * nb_pages * nb_data_pages - nb_tasks_failed
-    connector = aiohttp.TCPConnector(limit_per_host=max_concurrent_requests)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        if not os.path.exists('LiSSa/LiSSa_data/'):
-            os.makedirs('LiSSa/LiSSa_data/')
-        async with aiofiles.open(f'LiSSa/LiSSa_data/{filename}_lissa_fr.csv', "w", encoding="utf-8", newline='') as file:
-            writer = csv.writer(file, delimiter='|')
-            for page in range(1, nb_pages+1):
-                urls = await search_lissa(session, query, page, nb_data_pages)
-                update_progress_bar(progress_bar, lissa_progress_label, 0, nb_data_pages-len(urls))
-                tasks = [extract_article_data(session, url, query, meshTree, writer, progress_bar, lissa_progress_label) for url in urls]
-                await asyncio.gather(*tasks)
\ No newline at end of file
+    await LiSSaReqMulti([query], filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType, max_concurrent_requests, sink)
+
+if __name__ == "__main__":
+    # Per-page parse time of both extraction paths on saved article pages:
+    # python -m LiSSa.LiSSa_search.LiSSa page1.html page2.html ...
+    import sys
+    import timeit
+
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding="utf-8") as page:
+            content = page.read()
+        if parse_article_page_lxml(content) != parse_article_page_soup(content):
+            print(f"{path} : the two paths disagree")
+        for parser in (parse_article_page_soup, parse_article_page_lxml):
+            runs = timeit.repeat(lambda: parser(content), number=20, repeat=3)
+            print(f"{path} {parser.__name__} : {min(runs) / 20 * 1000:.2f} ms/page")
@@ -1,9 +1,7 @@
-import asyncio
-
-from LiSSa.LiSSa_search.LiSSa import LiSSaReq
+from LiSSa.LiSSa_search.LiSSa import LiSSaReqMulti
 from MeSH.meshData_func import depthMeshFrenchTitle
 
-def LiSSaReqMesh(search, filename, nb_pages, nb_data_pages, depth, meshTree, progress_bar, lissa_progress_label):
+async def LiSSaReqMesh(search, filename, nb_pages, nb_data_pages, depth, meshTree, progress_bar, lissa_progress_label, openType="w", sink='csv'):
     """
     Searches LiSSa for multiple MeSH terms at different depths and retrieves data based on the search results.
 
@@ -16,14 +14,15 @@ def LiSSaReqMesh(search, filename, nb_pages, nb_data_pages, depth, meshTree, pro
     meshTree (list): The mesh data to use for finding mesh terms.
     progress_bar (QProgressBar): The progress bar to update.
     lissa_progress_label (QLabel): The progress label to update.
+    openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     bool: Always returns False.
     """
     # Generate a list of titles based on the depth in the MeSH tree
     titleList = depthMeshFrenchTitle(search, depth, meshTree)
-    # Loop through the titles and perform PubMed requests
-    for i, title in enumerate(titleList):
-        asyncio.run(LiSSaReq(title, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, len(titleList), i))
+    # Search all the titles concurrently into the same file
+    await LiSSaReqMulti(titleList, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType, sink=sink)
 
     return False
\ No newline at end of file
@@ -1,9 +1,7 @@
-import asyncio
-
 from LiSSa.LiSSa_search.LiSSa import LiSSaReq
 from MeSH.meshData_func import englishToFrench
 
-def LiSSaReqText(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label):
+async def LiSSaReqText(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType="w", sink='csv'):
     """
     Searches LiSSa for text converted to French and retrieves data based on the search results.
 
@@ -15,11 +13,13 @@ def LiSSaReqText(search, filename, nb_pages, nb_data_pages, meshTree, progress_b
     meshTree (list): The mesh data to use for finding mesh terms.
     progress_bar (QProgressBar): The progress bar to update.
     lissa_progress_label (QLabel): The progress label to update.
+    openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     bool: Always returns False.
     """
     search = englishToFrench(search, meshTree)
-    asyncio.run(LiSSaReq(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label))
+    await LiSSaReq(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType, sink=sink)
     
     return False
\ No newline at end of file
@@ -1,8 +1,6 @@
-import asyncio
-
 from LiSSa.LiSSa_search.LiSSa import LiSSaReq
 
-def LiSSaReqUI(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label):
+async def LiSSaReqUI(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType="w", sink='csv'):
     """
     Searches LiSSa for a unique ID and retrieves data based on the search results.
 
@@ -14,6 +12,8 @@ def LiSSaReqUI(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar
     meshTree (list): The mesh data to use for finding mesh terms.
     progress_bar (QProgressBar): The progress bar to update.
     lissa_progress_label (QLabel): The progress label to update.
+    openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     bool: Always returns False.
@@ -27,6 +27,6 @@ def LiSSaReqUI(search, filename, nb_pages, nb_data_pages, meshTree, progress_bar
             break
     
     if title:
-        asyncio.run(LiSSaReq(title, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label))
+        await LiSSaReq(title, filename, nb_pages, nb_data_pages, meshTree, progress_bar, lissa_progress_label, openType, sink=sink)
 
     return False
\ No newline at end of file
@@ -0,0 +1,48 @@
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Extensions of the CSV outputs, compressed or not
+CSV_EXTENSIONS = ('.csv', '.csv.gz', '.csv.zst')
+
+# Compression levels of the compressed outputs
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+def is_csv_output(filename):
+    """
+    Checks whether a file is a CSV output, compressed or not.
+
+    Args:
+        filename (str): The name of the file.
+
+    Returns:
+        bool: True for .csv, .csv.gz and .csv.zst files.
+    """
+    return filename.endswith(CSV_EXTENSIONS)
+
+def open_text(path, mode='r'):
+    """
+    Opens a text file, compressing or decompressing it on the fly according to
+    its extension: gzip for .gz, zstd on all the CPU cores for .zst. Appending
+    adds a new gzip member or zstd frame, which readers read as one stream.
+
+    Args:
+        path (str): Path to the file.
+        mode (str): 'r', 'w' or 'a'.
+
+    Returns:
+        file: The file opened in text mode.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', compresslevel=GZIP_LEVEL, encoding="utf-8", newline='')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("zstandard is required to read and write .zst files")
+        if mode == 'r':
+            return zstandard.open(path, 'rt', encoding="utf-8", newline='')
+        return zstandard.open(path, mode + 't', cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1), encoding="utf-8", newline='')
+    return open(path, mode, encoding="utf-8", newline='')
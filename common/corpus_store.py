@@ -0,0 +1,233 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+
+# Folder of the corpora written by the SQLite sink
+CORPUS_FOLDER = 'corpus/'
+
+# A PubMed row carries the url of its page of search results, shared by all
+# the articles of the page, so a document is identified by its source, url and title
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    source TEXT NOT NULL,
+    language TEXT,
+    mesh_codes TEXT,
+    unique_ids TEXT,
+    title TEXT NOT NULL,
+    content TEXT,
+    UNIQUE (source, url, title)
+);
+CREATE INDEX IF NOT EXISTS documents_source ON documents (source, language);
+CREATE TABLE IF NOT EXISTS doc_mesh (
+    doc_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (doc_id, kind, code)
+);
+CREATE INDEX IF NOT EXISTS doc_mesh_code ON doc_mesh (kind, code);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(title, content, content='documents', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    DELETE FROM doc_mesh WHERE doc_id = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+END;
+"""
+
+def split_codes(codes):
+    """
+    Splits a ';' separated list of MeSH codes or unique IDs.
+
+    Args:
+        codes (str): The codes, e.g. 'C14.280;C14.907'.
+
+    Returns:
+        list: The non-empty codes.
+    """
+    return [code for code in dict.fromkeys(codes.split(";")) if code]
+
+class CorpusStore:
+    """
+    A corpus of retrieved documents in SQLite, with the MeSH codes and unique
+    IDs of each document in a join table and an FTS5 index over the titles and
+    contents.
+    """
+
+    def __init__(self, path):
+        """
+        Opens the corpus, creating it if needed.
+
+        Args:
+            path (str): Path to the SQLite database.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def clear(self, source, language):
+        """
+        Deletes the documents of a source in a language.
+
+        Args:
+            source (str): The source, e.g. 'pubmed'.
+            language (str): The language, e.g. 'en'.
+        """
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM documents WHERE source = ? AND language = ?", (source, language))
+
+    def insert_rows(self, rows, source, language):
+        """
+        Inserts or updates documents in one transaction. A document already
+        in the corpus, with the same source, url and title, is updated.
+
+        Args:
+            rows (list): The url, mesh codes, unique IDs, title and content of each document.
+            source (str): The source of the documents, e.g. 'pubmed'.
+            language (str): The language of the documents, e.g. 'en'.
+        """
+        with self.lock, self.db:
+            for url, mesh_codes, unique_ids, title, content in rows:
+                self.db.execute("""INSERT INTO documents (url, source, language, mesh_codes, unique_ids, title, content)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (source, url, title) DO UPDATE SET language = excluded.language,
+                        mesh_codes = excluded.mesh_codes, unique_ids = excluded.unique_ids,
+                        content = excluded.content""", (url, source, language, mesh_codes, unique_ids, title, content))
+                doc_id = self.db.execute("SELECT id FROM documents WHERE source = ? AND url = ? AND title = ?", (source, url, title)).fetchone()[0]
+                self.db.execute("DELETE FROM doc_mesh WHERE doc_id = ?", (doc_id,))
+                self.db.executemany("INSERT OR IGNORE INTO doc_mesh VALUES (?, ?, ?)",
+                                    [(doc_id, 'mesh', code) for code in split_codes(mesh_codes)] +
+                                    [(doc_id, 'ui', ui) for ui in split_codes(unique_ids)])
+
+    def urls(self, source, language):
+        """
+        Lists the urls of the documents of a source in a language.
+
+        Args:
+            source (str): The source, e.g. 'pubmed'.
+            language (str): The language, e.g. 'en'.
+
+        Returns:
+            list: The urls.
+        """
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT DISTINCT url FROM documents WHERE source = ? AND language = ?", (source, language))]
+
+    def search(self, query, limit=20, code=None, kind='mesh', source=None, language=None):
+        """
+        Searches the titles and contents with the full-text index.
+
+        Args:
+            query (str): The FTS5 query, e.g. 'heart AND failure'.
+            limit (int): The maximum number of results.
+            code (str): Only keep the documents tagged with this MeSH code (or
+                one of its descendants) or unique ID.
+            kind (str): 'mesh' or 'ui', the kind of the code.
+            source (str): Only keep the documents of this source.
+            language (str): Only keep the documents in this language.
+
+        Returns:
+            list: The url, source, language, title and a snippet of the content of
+                  each result, best match first.
+        """
+        sql = """SELECT d.url, d.source, d.language, d.title, snippet(documents_fts, 1, '[', ']', '...', 12)
+            FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid
+            WHERE documents_fts MATCH ?"""
+        params = [query]
+        if code is not None:
+            sql += " AND d.id IN (SELECT doc_id FROM doc_mesh WHERE kind = ? AND (code = ? OR code LIKE ?))"
+            params += [kind, code, code + '.%']
+        if source is not None:
+            sql += " AND d.source = ?"
+            params.append(source)
+        if language is not None:
+            sql += " AND d.language = ?"
+            params.append(language)
+        sql += " ORDER BY bm25(documents_fts) LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def documents_for_code(self, code, kind='mesh', limit=100):
+        """
+        Lists the documents tagged with a MeSH code, or one of its descendants, or a unique ID.
+
+        Args:
+            code (str): The MeSH code or unique ID.
+            kind (str): 'mesh' or 'ui', the kind of the code.
+            limit (int): The maximum number of results.
+
+        Returns:
+            list: The url, source, language and title of each document.
+        """
+        with self.lock:
+            return self.db.execute("""SELECT DISTINCT d.url, d.source, d.language, d.title
+                FROM doc_mesh m JOIN documents d ON d.id = m.doc_id
+                WHERE m.kind = ? AND (m.code = ? OR m.code LIKE ?) LIMIT ?""", (kind, code, code + '.%', limit)).fetchall()
+
+    def counts(self):
+        """
+        Counts the documents of each source and language.
+
+        Returns:
+            list: The source, language and number of documents.
+        """
+        with self.lock:
+            return self.db.execute("SELECT source, language, COUNT(*) FROM documents GROUP BY source, language").fetchall()
+
+if __name__ == "__main__":
+    # python -m common.corpus_store corpus/heart.sqlite search "heart NEAR failure" --mesh C14.280
+    parser = argparse.ArgumentParser(description="Query a SQLite corpus of retrieved documents.")
+    parser.add_argument('corpus', help="Path to the corpus database")
+    commands = parser.add_subparsers(dest='command', required=True)
+    search_parser = commands.add_parser('search', help="Full-text search over titles and contents")
+    search_parser.add_argument('query', help="FTS5 query")
+    search_parser.add_argument('--mesh', help="Only documents tagged with this MeSH code or its descendants")
+    search_parser.add_argument('--ui', help="Only documents tagged with this unique ID")
+    search_parser.add_argument('--source', help="Only documents of this source (pubmed, lissa, wikipedia)")
+    search_parser.add_argument('--language', help="Only documents in this language (en, fr)")
+    search_parser.add_argument('--limit', type=int, default=20)
+    code_parser = commands.add_parser('code', help="Documents tagged with a MeSH code or unique ID")
+    code_parser.add_argument('code')
+    code_parser.add_argument('--ui', action='store_true', help="The code is a unique ID")
+    code_parser.add_argument('--limit', type=int, default=100)
+    import_parser = commands.add_parser('import', help="Import an existing '|' delimited output file")
+    import_parser.add_argument('file')
+    import_parser.add_argument('--source', required=True)
+    import_parser.add_argument('--language', required=True)
+    commands.add_parser('count', help="Number of documents per source and language")
+    args = parser.parse_args()
+
+    store = CorpusStore(args.corpus)
+    if args.command == 'search':
+        code, kind = (args.ui, 'ui') if args.ui else (args.mesh, 'mesh')
+        for url, source, language, title, snippet in store.search(args.query, args.limit, code, kind, args.source, args.language):
+            print(f"{title} ({source}, {language})\n  {url}\n  {snippet}\n")
+    elif args.command == 'code':
+        for url, source, language, title in store.documents_for_code(args.code, 'ui' if args.ui else 'mesh', args.limit):
+            print(f"{title} ({source}, {language}) {url}")
+    elif args.command == 'import':
+        with open(args.file, 'r', encoding="utf-8", newline='') as f:
+            rows = [row for row in csv.reader(f, delimiter='|') if len(row) == 5]
+        store.insert_rows(rows, args.source, args.language)
+        print(f"{len(rows)} document(s) imported")
+    else:
+        for source, language, count in store.counts():
+            print(f"{source} {language}: {count}")
+    store.close()
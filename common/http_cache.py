@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Location of the response cache shared by every source
+HTTP_CACHE_PATH = 'cache/http_cache.sqlite'
+
+# Time in seconds during which a cached response is served without asking the server
+HTTP_CACHE_TTLS = {
+    'pubmed': 24 * 3600,
+    'lissa': 7 * 24 * 3600,
+    'wikipedia': 7 * 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+
+# Maximum size of the cached bodies, the least recently used entries are evicted beyond it
+HTTP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Number of cache hits whose access times are written together
+ACCESS_BATCH = 100
+
+def cache_key(url, params=None):
+    """
+    Computes the key of a request: the SHA-256 of its normalized URL, with the
+    query parameters of the URL and of params merged and sorted.
+
+    Args:
+        url (str): The URL of the request.
+        params (dict): The parameters of the GET request.
+
+    Returns:
+        str: The hexadecimal key of the request.
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(str(k), str(v)) for k, v in (params or {}).items()]
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(sorted(query)), ''))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+class CachedResponse:
+    """
+    The status and body of a response, whether it comes from the network or the cache.
+    """
+
+    def __init__(self, status, text, from_cache=False):
+        self.status = status
+        self.text = text
+        self.from_cache = from_cache
+
+    def json(self):
+        """
+        Decodes the body of the response.
+
+        Returns:
+            object: The decoded JSON body.
+        """
+        return json.loads(self.text)
+
+class HttpCache:
+    """
+    A content-addressed store of HTTP responses in SQLite, with per-source
+    expiry, ETag/Last-Modified revalidation and LRU eviction.
+
+    The database and the compression are used from the event loop through
+    run, on a thread of the cache, so that the requests are not held back by
+    the disk. The access times of the hits are kept in memory and written by
+    batches of ACCESS_BATCH, before any eviction and on close.
+    """
+
+    def __init__(self, path=HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES, ttls=None):
+        """
+        Opens the cache, creating it if needed.
+
+        Args:
+            path (str): Path to the SQLite database.
+            max_bytes (int): Maximum size of the stored bodies.
+            ttls (dict): Time to live in seconds of each source.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = {**HTTP_CACHE_TTLS, **(ttls or {})}
+        self.hits = 0
+        self.misses = 0
+        self.accessed = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            source TEXT,
+            body BLOB,
+            size INTEGER,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL,
+            last_access REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def ttl(self, source):
+        return self.ttls.get(source, DEFAULT_TTL)
+
+    async def run(self, function, *args):
+        """
+        Runs a blocking method of the cache on the thread of the cache.
+
+        Args:
+            function (callable): The method, e.g. self.get.
+            *args: Its arguments.
+
+        Returns:
+            The result of the method.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def get(self, key):
+        """
+        Reads an entry and marks it as recently used, the access time being
+        written with the next batch.
+
+        Args:
+            key (str): The key of the request.
+
+        Returns:
+            tuple: The body, ETag, Last-Modified and fetch time of the entry, or None.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ACCESS_BATCH:
+                with self.db:
+                    self.write_accesses()
+        return zlib.decompress(row[0]).decode('utf-8'), row[1], row[2], row[3]
+
+    def put(self, key, source, text, etag=None, last_modified=None):
+        """
+        Stores a response, then evicts the least recently used entries if the cache is too big.
+
+        Args:
+            key (str): The key of the request.
+            source (str): The source of the request, e.g. 'pubmed'.
+            text (str): The body of the response.
+            etag (str): The ETag header of the response.
+            last_modified (str): The Last-Modified header of the response.
+        """
+        body = zlib.compress(text.encode('utf-8'))
+        now = time.time()
+        with self.lock, self.db:
+            self.write_accesses()
+            previous = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, source, body, len(body), etag, last_modified, now, now))
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def refresh(self, key):
+        """
+        Restarts the time to live of an entry the server confirmed with a 304.
+
+        Args:
+            key (str): The key of the request.
+        """
+        with self.lock, self.db:
+            self.db.execute("UPDATE responses SET fetched_at = ? WHERE key = ?", (time.time(), key))
+
+    def write_accesses(self):
+        """
+        Writes the access times kept in memory. Called with the lock held, in a transaction.
+        """
+        self.db.executemany("UPDATE responses SET last_access = ? WHERE key = ?", [(accessed, key) for key, accessed in self.accessed.items()])
+        self.accessed = {}
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache is under 90% of its maximum size.
+        """
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def close(self):
+        with self.lock:
+            with self.db:
+                self.write_accesses()
+            self.db.close()
+        self.executor.shutdown()
+
+_cache = None
+
+def get_cache():
+    """
+    Gives the cache shared by every source, opened on first use.
+
+    Returns:
+        HttpCache: The shared cache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = HttpCache()
+    return _cache
+
+async def cached_get(session, url, params=None, source=None, cache=None):
+    """
+    Performs a GET request through the response cache.
+
+    A fresh entry is served without any request. A stale entry is revalidated
+    with its ETag/Last-Modified and served again if the server answers 304.
+    Only 200 responses are stored.
+
+    Args:
+        session (aiohttp.ClientSession): The session to use for the request.
+        url (str): The URL to fetch.
+        params (dict): The parameters of the GET request.
+        source (str): The source of the request, which sets the time to live, e.g. 'wikipedia'.
+        cache (HttpCache): The cache to use, the shared one by default.
+
+    Returns:
+        CachedResponse: The status and body of the response.
+    """
+    cache = cache or get_cache()
+    key = cache_key(url, params)
+    entry = await cache.run(cache.get, key)
+    headers = {}
+    if entry is not None:
+        text, etag, last_modified, fetched_at = entry
+        if time.time() - fetched_at < cache.ttl(source):
+            cache.hits += 1
+            return CachedResponse(200, text, from_cache=True)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    cache.misses += 1
+    async with session.get(url, params=params or {}, headers=headers) as response:
+        if response.status == 304 and entry is not None:
+            await cache.run(cache.refresh, key)
+            return CachedResponse(200, entry[0], from_cache=True)
+        text = await response.text()
+        if response.status == 200:
+            await cache.run(cache.put, key, source, text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return CachedResponse(response.status, text)
@@ -0,0 +1,55 @@
+import hashlib
+
+def url_key(url):
+    """
+    Computes the compact key stored for a URL.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        int: A 64-bit digest of the URL.
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big")
+
+class KnownUrls:
+    """
+    The URLs already saved in an output file, kept as 64-bit digests so that
+    large files stay cheap to hold in memory. They are loaded from an output
+    of any format by output_sink.load_known_urls.
+    """
+
+    def __init__(self):
+        self.keys = set()
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, url):
+        return url_key(url) in self.keys
+
+    def add(self, url):
+        """
+        Marks a URL as saved.
+
+        Args:
+            url (str): The URL.
+        """
+        self.keys.add(url_key(url))
+
+    def skip(self, url):
+        """
+        Checks a candidate URL before fetching it and counts it as skipped if
+        it is already saved.
+
+        Args:
+            url (str): The candidate URL.
+
+        Returns:
+            bool: True if the URL is already saved and must not be fetched.
+        """
+        if url in self:
+            self.skipped += 1
+            return True
+        return False
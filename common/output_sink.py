@@ -0,0 +1,449 @@
+import csv
+import datetime
+import glob
+import json
+import os
+import zlib
+
+from common.batch_writer import BatchWriter
+from common.compressed_io import open_text, zstandard
+from common.corpus_store import CorpusStore, CORPUS_FOLDER
+from common.known_urls import KnownUrls
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Columns of the rows written by every source
+COLUMNS = ['url', 'mesh descriptor', 'unique id', 'page title', 'page content']
+
+# Number of rows per Parquet row group
+ROW_GROUP_SIZE = 10000
+
+class CsvSink:
+    """
+    Writes the rows to a '|' delimited CSV file, in chunks on a background thread.
+    """
+    extension = '.csv'
+
+    def __init__(self, base_path, openType):
+        """
+        Args:
+            base_path (str): Path to the output without extension, e.g. 'pubmed/pubmed_data/heart_pubmed_en'.
+            openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+        """
+        self.path = base_path + self.extension
+        self.openType = openType
+
+    async def __aenter__(self):
+        self.batch = BatchWriter(self.write_rows)
+        self.file = await self.batch.run(open_text, self.path, self.openType)
+        self.writer = csv.writer(self.file, delimiter='|')
+        await self.batch.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.batch.close()
+        finally:
+            self.file.close()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    async def writerow(self, row):
+        """
+        Buffers a row to be written.
+
+        Args:
+            row (list): The url, mesh descriptors, unique IDs, title and content.
+        """
+        await self.batch.writerow(row)
+
+    @classmethod
+    def read_urls(cls, base_path):
+        """
+        Reads the urls already saved in the output.
+
+        Args:
+            base_path (str): Path to the output without extension.
+
+        Yields:
+            str: The saved urls.
+        """
+        if os.path.exists(base_path + cls.extension):
+            with open_text(base_path + cls.extension) as f:
+                for row in csv.reader(f, delimiter='|'):
+                    if row:
+                        yield row[0]
+
+class GzipCsvSink(CsvSink):
+    """
+    Writes the rows to a gzip compressed '|' delimited CSV file.
+    """
+    extension = '.csv.gz'
+
+class ZstdCsvSink(CsvSink):
+    """
+    Writes the rows to a '|' delimited CSV file compressed with zstd on all the CPU cores.
+    """
+    extension = '.csv.zst'
+
+    def __init__(self, base_path, openType):
+        if zstandard is None:
+            raise ImportError("zstandard is required to write .csv.zst output")
+        super().__init__(base_path, openType)
+
+class ParquetSink:
+    """
+    Writes the rows to a directory of Parquet files, one part file per run,
+    in zstd compressed row groups with dictionary encoded MeSH descriptors and
+    unique IDs. Parquet files cannot be appended to, so the append mode adds a
+    part file and the write mode replaces all of them.
+    """
+    extension = '.parquet'
+
+    def __init__(self, base_path, openType, row_group_size=ROW_GROUP_SIZE):
+        """
+        Args:
+            base_path (str): Path to the output without extension, e.g. 'pubmed/pubmed_data/heart_pubmed_en'.
+            openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+            row_group_size (int): The number of rows per row group.
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required to write Parquet output")
+        self.directory = base_path + self.extension
+        self.openType = openType
+        self.row_group_size = row_group_size
+        self.schema = pa.schema([(column, pa.string()) for column in COLUMNS])
+
+    async def __aenter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.openType == 'w':
+            for part in glob.glob(os.path.join(self.directory, 'part-*.parquet')):
+                os.remove(part)
+        self.path = os.path.join(self.directory, f"part-{datetime.datetime.now():%Y%m%d-%H%M%S-%f}.parquet")
+        self.writer = pq.ParquetWriter(self.path, self.schema, compression='zstd', use_dictionary=['mesh descriptor', 'unique id'])
+        # Flushed by count only, so that every row group but the last is full
+        self.batch = BatchWriter(self.write_row_group, max_rows=self.row_group_size, max_delay=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.batch.close()
+        finally:
+            self.writer.close()
+
+    def write_row_group(self, rows):
+        table = pa.table({column: [str(row[i]) for row in rows] for i, column in enumerate(COLUMNS)}, schema=self.schema)
+        self.writer.write_table(table)
+
+    async def writerow(self, row):
+        """
+        Buffers a row and writes a row group once enough rows are buffered.
+
+        Args:
+            row (list): The url, mesh descriptors, unique IDs, title and content.
+        """
+        await self.batch.writerow(row)
+
+    @classmethod
+    def read_urls(cls, base_path):
+        """
+        Reads the urls already saved in the output.
+
+        Args:
+            base_path (str): Path to the output without extension.
+
+        Yields:
+            str: The saved urls.
+        """
+        for part in sorted(glob.glob(os.path.join(base_path + cls.extension, 'part-*.parquet'))):
+            yield from pq.read_table(part, columns=['url']).column('url').to_pylist()
+
+def shard_key(row, shard_by):
+    """
+    Gives the shard of a row.
+
+    Args:
+        row (list): The url, mesh descriptors, unique IDs, title and content.
+        shard_by (str): 'tree' to shard by the first segment of the first MeSH
+            tree number, e.g. 'C14', or 'hash:N' to spread the rows over N
+            shards by a hash of their url.
+
+    Returns:
+        str: The key of the shard.
+    """
+    if shard_by == 'tree':
+        code = row[1].split(";")[0]
+        return code.split(".")[0] if code else 'none'
+    nb_shards = int(shard_by.split(":")[1])
+    return f"{zlib.crc32(row[0].encode('utf-8')) % nb_shards:03d}"
+
+def manifest_path(base_path):
+    return base_path + '.manifest.json'
+
+def read_manifest(path):
+    """
+    Reads the manifest of a sharded output.
+
+    Args:
+        path (str): Path to the manifest.
+
+    Returns:
+        dict: The sharding ('shard_by') and the file and row count of each shard ('shards').
+    """
+    with open(path, 'r', encoding="utf-8") as f:
+        return json.load(f)
+
+def manifest_files(path):
+    """
+    Lists the shard files of a sharded output. The files that no longer
+    exist, e.g. deleted by hand, are left out.
+
+    Args:
+        path (str): Path to the manifest.
+
+    Returns:
+        list: The paths of the shard files.
+    """
+    folder = os.path.dirname(path)
+    files = [os.path.join(folder, shard['file']) for _, shard in sorted(read_manifest(path)['shards'].items())]
+    return [file for file in files if os.path.exists(file)]
+
+class ShardedSink:
+    """
+    Writes the rows to several '|' delimited CSV files, <output>.<shard>.csv,
+    sharded by MeSH category or by a hash of the url, and lists the shards
+    and their row counts in <output>.manifest.json. All the shards are
+    written by the same batched writer thread.
+    """
+    extension = '.csv'
+
+    def __init__(self, base_path, openType, shard_by='tree'):
+        """
+        Args:
+            base_path (str): Path to the output without extension, e.g. 'pubmed/pubmed_data/heart_pubmed_en'.
+            openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+            shard_by (str): 'tree' or 'hash:N', see shard_key.
+        """
+        self.base_path = base_path
+        self.openType = openType
+        self.shard_by = shard_by
+        self.files = {}
+
+    async def __aenter__(self):
+        self.manifest = {'shard_by': self.shard_by, 'shards': {}}
+        if os.path.exists(manifest_path(self.base_path)):
+            previous = read_manifest(manifest_path(self.base_path))
+            if self.openType == 'a':
+                if previous['shard_by'] != self.shard_by:
+                    raise ValueError(f"{self.base_path} is sharded by {previous['shard_by']}, not {self.shard_by}")
+                self.manifest = previous
+            else:
+                for path in manifest_files(manifest_path(self.base_path)):
+                    os.remove(path)
+                # The manifest lists no shard until the first rows are written
+                self.write_manifest()
+        self.batch = BatchWriter(self.write_rows)
+        await self.batch.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.batch.close()
+        finally:
+            for file, _ in self.files.values():
+                file.close()
+
+    def write_rows(self, rows):
+        shards = {}
+        for row in rows:
+            shards.setdefault(shard_key(row, self.shard_by), []).append(row)
+        for key, shard_rows in shards.items():
+            if key not in self.files:
+                shard = self.manifest['shards'].setdefault(key, {'file': f"{os.path.basename(self.base_path)}.{key}{self.extension}", 'rows': 0})
+                file = open_text(os.path.join(os.path.dirname(self.base_path), shard['file']), 'a' if shard['rows'] else 'w')
+                self.files[key] = (file, csv.writer(file, delimiter='|'))
+            file, writer = self.files[key]
+            writer.writerows(shard_rows)
+            file.flush()
+            self.manifest['shards'][key]['rows'] += len(shard_rows)
+        self.write_manifest()
+
+    def write_manifest(self):
+        with open(manifest_path(self.base_path), 'w', encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+
+    async def writerow(self, row):
+        """
+        Buffers a row to be written to its shard.
+
+        Args:
+            row (list): The url, mesh descriptors, unique IDs, title and content.
+        """
+        await self.batch.writerow(row)
+
+    @classmethod
+    def read_urls(cls, base_path):
+        """
+        Reads the urls already saved in the shards.
+
+        Args:
+            base_path (str): Path to the output without extension.
+
+        Yields:
+            str: The saved urls.
+        """
+        if os.path.exists(manifest_path(base_path)):
+            for path in manifest_files(manifest_path(base_path)):
+                with open_text(path) as f:
+                    for row in csv.reader(f, delimiter='|'):
+                        if row:
+                            yield row[0]
+
+def output_metadata(base_path):
+    """
+    Splits the path of an output into the name chosen by the user, the source and the language.
+
+    Args:
+        base_path (str): Path to the output without extension, e.g. 'pubmed/pubmed_data/heart_pubmed_en'.
+
+    Returns:
+        tuple: The name, source and language of the output, e.g. ('heart', 'pubmed', 'en').
+    """
+    source = os.path.normpath(base_path).split(os.sep)[0].lower()
+    name, language = os.path.basename(base_path).rsplit('_', 1)
+    if name.endswith('_' + source):
+        name = name[:-len(source) - 1]
+    return name, source, language
+
+class SqliteSink:
+    """
+    Writes the rows to the SQLite corpus shared by every source for the name
+    chosen by the user, corpus/<name>.sqlite, in one transaction per batch.
+    The write mode replaces the documents of the source in the language. A
+    row updates the document with the same source, url and title, so the
+    articles of a PubMed page, which share its url, are kept apart.
+    """
+    extension = '.sqlite'
+
+    def __init__(self, base_path, openType):
+        """
+        Args:
+            base_path (str): Path to the output without extension, e.g. 'pubmed/pubmed_data/heart_pubmed_en'.
+            openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+        """
+        self.name, self.source, self.language = output_metadata(base_path)
+        self.path = SqliteSink.corpus_path(base_path)
+        self.openType = openType
+
+    @staticmethod
+    def corpus_path(base_path):
+        return os.path.join(CORPUS_FOLDER, output_metadata(base_path)[0] + SqliteSink.extension)
+
+    async def __aenter__(self):
+        self.batch = BatchWriter(self.write_rows)
+        self.store = await self.batch.run(CorpusStore, self.path)
+        if self.openType == 'w':
+            await self.batch.run(self.store.clear, self.source, self.language)
+        await self.batch.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            await self.batch.close()
+        finally:
+            self.store.close()
+
+    def write_rows(self, rows):
+        self.store.insert_rows(rows, self.source, self.language)
+
+    async def writerow(self, row):
+        """
+        Buffers a row to be inserted.
+
+        Args:
+            row (list): The url, mesh descriptors, unique IDs, title and content.
+        """
+        await self.batch.writerow(row)
+
+    @classmethod
+    def read_urls(cls, base_path):
+        """
+        Reads the urls already saved in the corpus for the source and language.
+
+        Args:
+            base_path (str): Path to the output without extension.
+
+        Returns:
+            list: The saved urls.
+        """
+        if not os.path.exists(cls.corpus_path(base_path)):
+            return []
+        _, source, language = output_metadata(base_path)
+        store = CorpusStore(cls.corpus_path(base_path))
+        urls = store.urls(source, language)
+        store.close()
+        return urls
+
+# Output formats selectable for every source
+SINKS = {
+    'csv': CsvSink,
+    'csv.gz': GzipCsvSink,
+    'csv.zst': ZstdCsvSink,
+    'parquet': ParquetSink,
+    'sqlite': SqliteSink,
+    'sharded': ShardedSink,
+}
+
+def sink_class(sink):
+    """
+    Gives the class of an output format. A sharded output can be given its
+    sharding after a colon, e.g. 'sharded:hash:16'.
+
+    Args:
+        sink (str): The output format.
+
+    Returns:
+        type: The class of the sink.
+    """
+    return SINKS[sink.split(":")[0]]
+
+def open_sink(sink, base_path, openType):
+    """
+    Opens the output of a run in the selected format.
+
+    Args:
+        sink (str): The output format, one of SINKS, e.g. 'csv' or 'sharded:hash:16'.
+        base_path (str): Path to the output without extension, e.g. 'pubmed/pubmed_data/heart_pubmed_en'.
+        openType (str): The file open mode, e.g., 'w' for write, 'a' for append.
+
+    Returns:
+        The sink, to be used as an asynchronous context manager.
+    """
+    if sink.startswith('sharded:'):
+        return ShardedSink(base_path, openType, sink.split(":", 1)[1])
+    return sink_class(sink)(base_path, openType)
+
+def load_known_urls(sink, base_path, openType):
+    """
+    Loads the urls of an output that is about to be appended to.
+
+    Args:
+        sink (str): The output format, one of SINKS.
+        base_path (str): Path to the output without extension.
+        openType (str): The mode in which the output will be opened.
+
+    Returns:
+        KnownUrls: The saved urls, empty unless the output is opened in append mode.
+    """
+    known_urls = KnownUrls()
+    if openType == "a":
+        for url in sink_class(sink).read_urls(base_path):
+            known_urls.add(url)
+    return known_urls
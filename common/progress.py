@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+# Time in seconds between two updates of the progress display (10 Hz)
+REPORT_INTERVAL = 0.1
+
+def format_duration(seconds):
+    """
+    Formats a duration as minutes and seconds, e.g. '2m 5s'.
+    """
+    return f"{int(seconds / 60)}m {int(seconds % 60)}s"
+
+@dataclass
+class ProgressSnapshot:
+    """
+    The state of a run at one point in time.
+
+    Attributes:
+    name (str): The name of the source, e.g. 'PUBMED'.
+    total (int): The number of tasks expected.
+    done (int): The number of tasks that retrieved a document.
+    failed (int): The number of tasks that did not.
+    skipped (int): The number of tasks skipped because their document was already saved.
+    elapsed (float): The time in seconds since the start of the run.
+    """
+    name: str
+    total: int
+    done: int
+    failed: int
+    skipped: int
+    elapsed: float
+
+    @property
+    def finished(self):
+        return self.done + self.failed + self.skipped
+
+    @property
+    def percent(self):
+        return min(100, int(self.finished / self.total * 100)) if self.total > 0 else 0
+
+    @property
+    def rate(self):
+        """
+        The number of tasks finished per second.
+        """
+        return self.finished / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        The estimated time in seconds before the end of the run, None before the first finished task.
+        """
+        if self.rate == 0:
+            return None
+        return max(0, self.total - self.finished) / self.rate
+
+    def format(self):
+        """
+        Formats the snapshot for a progress label or the console.
+
+        Returns:
+            str: e.g. 'PUBMED 42% (420/1000) [Done : 400 Failed : 15 Skipped : 5] 12.3/s 0m 34s ETA 0m 47s'.
+        """
+        eta = "--" if self.eta is None else format_duration(self.eta)
+        return (f"{self.name} {self.percent}% ({self.finished}/{self.total}) "
+                f"[Done : {self.done} Failed : {self.failed} Skipped : {self.skipped}] "
+                f"{self.rate:.1f}/s {format_duration(self.elapsed)} ETA {eta}")
+
+class ProgressTracker:
+    """
+    The progress counters of one run of a source.
+
+    Counting a task is only an increment under a lock, so the tasks can count
+    each of their documents without touching the display; a ProgressReporter
+    reads the counters at a fixed rate. Every run has its own tracker, so
+    several runs, of the same source or not, can happen at the same time.
+    """
+
+    def __init__(self, name, total=0):
+        """
+        Args:
+            name (str): The name of the source in the display, e.g. 'PUBMED'.
+            total (int): The number of tasks expected.
+        """
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.start = time.monotonic()
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def add_total(self, total):
+        """
+        Adds tasks to the number of tasks expected.
+        """
+        with self.lock:
+            self.total += total
+            self.version += 1
+
+    def advance(self, done=0, failed=0, skipped=0):
+        """
+        Counts finished tasks.
+
+        Args:
+            done (int): The number of tasks that retrieved a document.
+            failed (int): The number of tasks that did not.
+            skipped (int): The number of tasks skipped because their document was already saved.
+        """
+        with self.lock:
+            self.done += done
+            self.failed += failed
+            self.skipped += skipped
+            self.version += 1
+
+    def snapshot(self):
+        """
+        Reads the counters.
+
+        Returns:
+            ProgressSnapshot: The state of the run.
+        """
+        with self.lock:
+            return ProgressSnapshot(self.name, self.total, self.done, self.failed, self.skipped, time.monotonic() - self.start)
+
+class ProgressReporter:
+    """
+    Pushes the snapshots of a tracker to a progress bar and a label, or to the
+    console without them, at most every REPORT_INTERVAL seconds and only when
+    the counters changed, however often the tasks count.
+
+    Used as an async context manager around the run, it shows the final state
+    when the run ends, cancelled or not.
+    """
+
+    def __init__(self, tracker, pbar=None, label=None, interval=REPORT_INTERVAL):
+        """
+        Args:
+            tracker (ProgressTracker): The counters to report.
+            pbar: The progress bar, any object with setValue(int).
+            label: The progress label, any object with setText(str).
+            interval (float): The time in seconds between two updates.
+        """
+        self.tracker = tracker
+        self.pbar = pbar
+        self.label = label
+        self.interval = interval
+        self.version = None
+        self.task = None
+
+    def push(self):
+        """
+        Shows the current state of the tracker if it changed since the last push.
+        """
+        if self.tracker.version == self.version:
+            return
+        self.version = self.tracker.version
+        snapshot = self.tracker.snapshot()
+        if self.pbar is None and self.label is None:
+            print(f"\r{snapshot.format()}", end='', flush=True)
+            return
+        if self.pbar is not None:
+            self.pbar.setValue(snapshot.percent)
+        if self.label is not None:
+            self.label.setText(snapshot.format())
+
+    async def report_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.push()
+
+    async def __aenter__(self):
+        self.push()
+        self.task = asyncio.create_task(self.report_periodically())
+        return self.tracker
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.task.cancel()
+        self.push()
+        if self.pbar is None and self.label is None:
+            print()
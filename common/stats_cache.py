@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+# Location of the per-file summaries of the statistics
+STATS_CACHE_PATH = 'cache/stats_cache.sqlite'
+
+# Size of the blocks read to hash a file
+BLOCK_SIZE = 1024 * 1024
+
+def hash_bytes(f, digest, size=None):
+    """
+    Feeds the next bytes of a binary file to a hash, by blocks of 1 MB.
+
+    Args:
+        f (file): The file opened in binary mode.
+        digest: The hashlib object.
+        size (int): The number of bytes, up to the end of the file by default.
+    """
+    while size is None or size > 0:
+        block = f.read(BLOCK_SIZE if size is None else min(BLOCK_SIZE, size))
+        if not block:
+            return
+        digest.update(block)
+        if size is not None:
+            size -= len(block)
+
+def file_digests(path, prefix_size=None, end=None):
+    """
+    Computes the SHA-256 of a file, and of its first bytes in the same read.
+
+    Args:
+        path (str): Path to the file.
+        prefix_size (int): Number of first bytes whose digest is also returned.
+        end (int): Number of bytes to hash, the whole file by default.
+
+    Returns:
+        tuple: The hexadecimal digests of the prefix (None without prefix_size) and of the file.
+    """
+    digest = hashlib.sha256()
+    prefix = None
+    with open(path, 'rb') as f:
+        if prefix_size is not None:
+            hash_bytes(f, digest, prefix_size)
+            prefix = digest.hexdigest()
+        hash_bytes(f, digest, None if end is None else end - f.tell())
+    return prefix, digest.hexdigest()
+
+class StatsCache:
+    """
+    The summaries of the files the statistics were computed on, in SQLite: for
+    each file and matching mode, its size, modification time and SHA-256 when
+    it was read, its scan (documents, word separators, unique IDs,
+    documents of each node of the MeSH tree and unique IDs of each document),
+    the MeSH titles counted in it and their counts.
+    """
+
+    def __init__(self, path=STATS_CACHE_PATH):
+        """
+        Opens the cache, creating it if needed.
+
+        Args:
+            path (str): Path to the SQLite database.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS summaries (
+            path TEXT NOT NULL,
+            word_boundaries INTEGER NOT NULL,
+            size INTEGER,
+            mtime INTEGER,
+            digest TEXT,
+            scan TEXT,
+            titles TEXT,
+            counts TEXT,
+            PRIMARY KEY (path, word_boundaries))""")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def get(self, path, word_boundaries):
+        """
+        Reads the summary of a file.
+
+        Args:
+            path (str): Path to the file.
+            word_boundaries (bool): Whether the titles were counted as whole words.
+
+        Returns:
+            dict: The size, mtime, digest, scan, titles and counts of the file, or None.
+        """
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime, digest, scan, titles, counts FROM summaries WHERE path = ? AND word_boundaries = ?",
+                                  (os.path.abspath(path), int(word_boundaries))).fetchone()
+        if row is None:
+            return None
+        nbDocuments, titleSeparators, abstractSeparators, uis, codeDocuments, documents = json.loads(row[3])
+        return {'size': row[0], 'mtime': row[1], 'digest': row[2],
+                'scan': (nbDocuments, titleSeparators, abstractSeparators, set(uis), codeDocuments, documents),
+                'titles': set(json.loads(row[4])), 'counts': json.loads(row[5])}
+
+    def put(self, path, word_boundaries, summary):
+        """
+        Stores the summary of a file, replacing the previous one.
+
+        Args:
+            path (str): Path to the file.
+            word_boundaries (bool): Whether the titles were counted as whole words.
+            summary (dict): The size, mtime, digest, scan, titles and counts of the file.
+        """
+        nbDocuments, titleSeparators, abstractSeparators, uis, codeDocuments, documents = summary['scan']
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (os.path.abspath(path), int(word_boundaries), summary['size'], summary['mtime'], summary['digest'],
+                             json.dumps([nbDocuments, titleSeparators, abstractSeparators, sorted(uis), codeDocuments, documents]),
+                             json.dumps(sorted(summary['titles'])), json.dumps(summary['counts'])))
@@ -0,0 +1,156 @@
+import csv
+from array import array
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = None
+    sparse = None
+
+from common.compressed_io import open_text
+
+# Number of most frequent MeSH pairs in the pair table
+TOP_PAIRS = 1000
+
+def file_documents(files):
+    """
+    Streams the unique id column of every document of CSV files.
+
+    Args:
+        files (list of str): The CSV files, optionally gzip (.csv.gz) or zstd (.csv.zst) compressed.
+
+    Yields:
+        str: The ';' separated unique IDs of each document.
+    """
+    for file in files:
+        with open_text(file) as f:
+            for row in csv.reader(f, delimiter='|'):
+                yield row[2]
+
+def incidence_matrix(documents):
+    """
+    Builds the sparse document x unique ID incidence matrix of documents in
+    one streaming pass. The rows are only kept as compact integer arrays of
+    column indices, so memory grows with the number of (document, unique ID)
+    pairs and not with the size of the documents.
+
+    Args:
+        documents (iterable of str): The unique id column of each document,
+            as kept in the stats summaries or read by file_documents.
+
+    Returns:
+        tuple: The CSR matrix, with a 1 where a document is tagged with a
+               unique ID, and the unique ID of each column.
+    """
+    if sparse is None:
+        raise ImportError("numpy and scipy are required to build the co-occurrence matrix")
+    columns = {}
+    indices = array('i')
+    indptr = array('q', [0])
+    for document in documents:
+        uis = {ui for ui in document.split(";") if ui}
+        indices.extend(sorted(columns.setdefault(ui, len(columns)) for ui in uis))
+        indptr.append(len(indices))
+    indices = np.frombuffer(indices, dtype=np.int32)
+    matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, np.frombuffer(indptr, dtype=np.int64)),
+                               shape=(len(indptr) - 1, len(columns)))
+    return matrix, list(columns)
+
+def cooccurrence_matrix(incidence):
+    """
+    Computes the unique ID x unique ID co-occurrence matrix: the number of
+    documents tagged with both unique IDs, with the number of documents of
+    each unique ID on the diagonal.
+
+    Args:
+        incidence (csr_matrix): The incidence matrix.
+
+    Returns:
+        csr_matrix: The co-occurrence matrix.
+    """
+    return (incidence.T @ incidence).tocsr()
+
+def top_pairs(cooccurrence, uis, titles, k=TOP_PAIRS):
+    """
+    Lists the pairs of unique IDs found together in the most documents.
+
+    Args:
+        cooccurrence (csr_matrix): The co-occurrence matrix.
+        uis (list of str): The unique ID of each column.
+        titles (dict): The title of each unique ID.
+        k (int): The number of pairs.
+
+    Returns:
+        list: The two titles and unique IDs, the number of documents with
+              both and their Jaccard index, most frequent pair first.
+    """
+    pairs = sparse.triu(cooccurrence, k=1).tocoo()
+    if pairs.nnz > k:
+        best = np.argpartition(pairs.data, -k)[-k:]
+    else:
+        best = np.arange(pairs.nnz)
+    best = best[np.argsort(-pairs.data[best], kind='stable')]
+    documents = cooccurrence.diagonal()
+    lines = []
+    for index in best:
+        a, b, both = pairs.row[index], pairs.col[index], int(pairs.data[index])
+        jaccard = both / (documents[a] + documents[b] - both)
+        lines.append([titles.get(uis[a], ''), uis[a], titles.get(uis[b], ''), uis[b], both, round(jaccard, 4)])
+    return lines
+
+def save_cooccurrence(path, incidence, cooccurrence, uis):
+    """
+    Saves the incidence and co-occurrence matrices and the unique IDs of their
+    columns in one compressed NPZ file, see load_cooccurrence.
+
+    Args:
+        path (str): Path to the .npz file.
+        incidence (csr_matrix): The incidence matrix.
+        cooccurrence (csr_matrix): The co-occurrence matrix.
+        uis (list of str): The unique ID of each column.
+    """
+    arrays = {'uis': np.array(uis, dtype=str)}
+    for name, matrix in (('incidence', incidence), ('cooccurrence', cooccurrence)):
+        arrays[f'{name}_data'] = matrix.data
+        arrays[f'{name}_indices'] = matrix.indices
+        arrays[f'{name}_indptr'] = matrix.indptr
+        arrays[f'{name}_shape'] = np.array(matrix.shape)
+    np.savez_compressed(path, **arrays)
+
+def load_cooccurrence(path):
+    """
+    Loads the matrices saved by save_cooccurrence.
+
+    Args:
+        path (str): Path to the .npz file.
+
+    Returns:
+        tuple: The incidence matrix, the co-occurrence matrix and the unique ID of each column.
+    """
+    with np.load(path) as arrays:
+        matrices = [sparse.csr_matrix((arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+                                      shape=tuple(arrays[f'{name}_shape'])) for name in ('incidence', 'cooccurrence')]
+        return matrices[0], matrices[1], [str(ui) for ui in arrays['uis']]
+
+def export_cooccurrence(documents, titles, npz_path, pairs_path, k=TOP_PAIRS):
+    """
+    Builds the incidence and co-occurrence matrices of documents, saves them
+    as NPZ and writes the table of the k most frequent pairs.
+
+    Args:
+        documents (iterable of str): The unique id column of each document, see incidence_matrix.
+        titles (dict): The title of each unique ID.
+        npz_path (str): Path to the .npz file.
+        pairs_path (str): Path to the '|' delimited pair table.
+        k (int): The number of pairs.
+
+    Returns:
+        tuple: The number of documents and of unique IDs.
+    """
+    incidence, uis = incidence_matrix(documents)
+    cooccurrence = cooccurrence_matrix(incidence)
+    save_cooccurrence(npz_path, incidence, cooccurrence, uis)
+    with open(pairs_path, 'w', encoding="utf-8", newline='') as f:
+        csv.writer(f, delimiter='|').writerows(top_pairs(cooccurrence, uis, titles, k))
+    return incidence.shape
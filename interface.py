@@ -1,4 +1,3 @@
-import asyncio
 import sys
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
@@ -16,6 +15,9 @@ from LiSSa.LiSSa_search.LiSSa_text import LiSSaReqText
 from LiSSa.LiSSa_search.LiSSa_mesh_code import LiSSaReqMesh
 from LiSSa.LiSSa_search.LiSSa_unique_ID import LiSSaReqUI
 from mesh_tree import MeshTree
+from retrieval_worker import RetrievalWorker
+
+NO_MORE_DATA = "There is no more data for this research"
 
 class MainWindow(QMainWindow):
 	def __init__(self):
@@ -27,6 +29,7 @@ class MainWindow(QMainWindow):
 		
 		self.hasChanged = False
 		self.changeTemp = False
+		self.worker = None
 		self.setup_ui()
 		self.initialize_widget_state()
 		self.set_time_suggestion()
@@ -165,16 +168,17 @@ class MainWindow(QMainWindow):
 		self.gather_button = QPushButton('Gather Data')
 		self.layout.addWidget(self.gather_button, alignment=Qt.AlignHCenter | Qt.AlignTop)
 
-        # Progress bar
-		self.progress_bar = QProgressBar()
-		self.progress_bar.hide()
-		self.layout.addWidget(self.progress_bar, alignment=Qt.AlignHCenter | Qt.AlignTop)
+        # Progress bar and label of each source, which run concurrently
+		self.pubmed_progress_bar = QProgressBar()
+		self.wiki_progress_bar = QProgressBar()
+		self.lissa_progress_bar = QProgressBar()
 		self.pubmed_progress_label = QLabel('', alignment=Qt.AlignCenter)
 		self.wiki_progress_label = QLabel('', alignment=Qt.AlignCenter)
 		self.lissa_progress_label = QLabel('', alignment=Qt.AlignCenter)
-		self.layout.addWidget(self.pubmed_progress_label, alignment=Qt.AlignHCenter | Qt.AlignTop)
-		self.layout.addWidget(self.wiki_progress_label, alignment=Qt.AlignHCenter | Qt.AlignTop)
-		self.layout.addWidget(self.lissa_progress_label, alignment=Qt.AlignHCenter | Qt.AlignTop)
+		for progress_bar, progress_label in ((self.pubmed_progress_bar, self.pubmed_progress_label), (self.wiki_progress_bar, self.wiki_progress_label), (self.lissa_progress_bar, self.lissa_progress_label)):
+			progress_bar.hide()
+			self.layout.addWidget(progress_bar, alignment=Qt.AlignHCenter | Qt.AlignTop)
+			self.layout.addWidget(progress_label, alignment=Qt.AlignHCenter | Qt.AlignTop)
 
 		self.wid.setLayout(self.layout)
 	
@@ -246,6 +250,14 @@ class MainWindow(QMainWindow):
 		self.language_layout = self.create_language_layout()
 		self.save_name_input = self.create_line_edit('', 'File Name')
 		self.overwrite_checkbox = QCheckBox("Overwrite the file?")
+		self.sink_combobox = QComboBox()
+		self.sink_combobox.addItem("CSV", "csv")
+		self.sink_combobox.addItem("CSV (gzip)", "csv.gz")
+		self.sink_combobox.addItem("CSV (zstd)", "csv.zst")
+		self.sink_combobox.addItem("CSV sharded by MeSH category", "sharded")
+		self.sink_combobox.addItem("Parquet", "parquet")
+		self.sink_combobox.addItem("SQLite", "sqlite")
+		self.sink_combobox.setToolTip('Output Format')
 
         # Add search components to layout
 		search_layout.addLayout(self.search_type_layout)
@@ -254,6 +266,7 @@ class MainWindow(QMainWindow):
 		search_layout.addLayout(self.language_layout)
 		search_layout.addWidget(self.save_name_input)
 		search_layout.addWidget(self.overwrite_checkbox, alignment=Qt.AlignCenter)
+		search_layout.addWidget(self.sink_combobox, alignment=Qt.AlignCenter)
 
 		return search_layout
 	
@@ -507,6 +520,10 @@ class MainWindow(QMainWindow):
 		"""
 		self.quit = QMessageBox.question(self, 'Quit', 'Are you sure you want to quit?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 		if self.quit == QMessageBox.Yes:
+			if self.worker is not None and self.worker.isRunning():
+				# Let the running retrievals close their outputs before leaving
+				self.worker.stop()
+				self.worker.wait()
 			sys.exit(0)
 
 	def inputs_values(self):
@@ -563,104 +580,100 @@ class MainWindow(QMainWindow):
 			self.depths = self.depth_input.text()
 
 		self.openType = "w" if self.overwrite_checkbox.isChecked() else "a"
+
+		self.sink = self.sink_combobox.currentData()
 	
 	def pubmed_data_gathering(self):
 		"""
-		Gather data from PubMed based on user inputs and selected options.
+		Queue the retrieval of data from PubMed based on user inputs and selected options.
 
-		This method handles the gathering of data from PubMed. It validates the input parameters 
-		and triggers data gathering accordingly. It also updates progress labels and displays 
+		This method validates the input parameters and adds the PubMed retrieval to the 
+		worker accordingly. It also updates progress labels and displays 
 		appropriate error messages if needed.
 		"""
 		if self.pubmed_checkbox.isChecked() and (self.nbId in [10,20,50,100,200] and self.nbPage != "" and self.nbPage > 0 and self.nbPageMin != "" and self.nbPageMin > 0 and self.search != "" and self.fileName != ""):
-			self.pubmed_progress_label.setText("PUBMED --- /%")
-			if self.wiki_checkbox.isChecked() and self.search != "" and self.fileName != "":
-				self.wiki_progress_label.setText("WIKIPEDIA --- /%")
-			if self.lissa_checkbox.isChecked() and self.search != "" and self.fileName != "":
-				self.lissa_progress_label.setText("LISSA --- /%")
-			QApplication.processEvents()
+			end_message = NO_MORE_DATA if not self.wiki_checkbox.isChecked() and not self.lissa_checkbox.isChecked() else None
+			pbar, label = self.worker.progress_bar('pubmed'), self.worker.progress_label('pubmed')
 			if self.text:
-				if ReqText(self.nbId, self.nbPage, self.nbPageMin, self.search, self.fileName, self.year, self.openType, self.meshTree, self.progress_bar, self.pubmed_progress_label) == False and not self.wiki_checkbox.isChecked() and not self.lissa_checkbox.isChecked():
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+				self.worker.add_job('pubmed', ReqText, self.nbId, self.nbPage, self.nbPageMin, self.search, self.fileName, self.year, self.openType, self.meshTree, pbar, label, self.sink, end_message=end_message)
 			elif self.mesh:
 				if not meshInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'Pubmed Error', "Be sure to use a mesh code available in the suggestions", QMessageBox.Ok, QMessageBox.Ok)
+					return
 				elif self.depths != "" and self.depths >= 0:
-					if ReqMesh(self.nbId, self.nbPage, self.nbPageMin, self.search, self.fileName, self.year, self.depths, self.openType, self.meshTree, self.progress_bar, self.pubmed_progress_label) == False and not self.wiki_checkbox.isChecked() and not self.lissa_checkbox.isChecked():
-						QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					self.worker.add_job('pubmed', ReqMesh, self.nbId, self.nbPage, self.nbPageMin, self.search, self.fileName, self.year, self.depths, self.openType, self.meshTree, pbar, label, self.sink, end_message=end_message)
 				else:
 					QMessageBox.question(self, 'Pubmed Error', "Depth input is wrong", QMessageBox.Ok, QMessageBox.Ok)
+					return
 			elif self.uniqueID:
 				if not uiInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'Pubmed Error', "Be sure to use a unique ID available in the suggestions", QMessageBox.Ok, QMessageBox.Ok)
-				elif ReqUI(self.nbId, self.nbPage, self.nbPageMin, self.search, self.fileName, self.year, self.openType, self.meshTree, self.progress_bar, self.pubmed_progress_label) == False and not self.wiki_checkbox.isChecked() and not self.lissa_checkbox.isChecked():
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					return
+				self.worker.add_job('pubmed', ReqUI, self.nbId, self.nbPage, self.nbPageMin, self.search, self.fileName, self.year, self.openType, self.meshTree, pbar, label, self.sink, end_message=end_message)
+			self.pubmed_progress_label.setText("PUBMED --- /%")
 		elif self.pubmed_checkbox.isChecked():
 			QMessageBox.question(self, 'Pubmed Error', "One or several of the input given for pubmed search is/are wrong", QMessageBox.Ok, QMessageBox.Ok)
 
 	def wikipedia_data_gathering(self):
 		"""
-		Gather data from Wikipedia based on user inputs and selected options.
+		Queue the retrieval of data from Wikipedia based on user inputs and selected options.
 
-		This method handles the gathering of data from Wikipedia. It validates the input parameters 
-		and triggers data gathering accordingly. It also updates progress labels and displays 
+		This method validates the input parameters and adds the Wikipedia retrieval to the 
+		worker accordingly. It also updates progress labels and displays 
 		appropriate error messages if needed.
 		"""
 		if self.wiki_checkbox.isChecked() and self.search != "" and self.fileName != "":
-			self.progress_bar.setValue(0)
-			self.wiki_progress_label.setText("WIKIPEDIA --- /%")
-			if self.lissa_checkbox.isChecked() and self.search != "" and self.fileName != "":
-				self.lissa_progress_label.setText("LISSA --- /%")
-			QApplication.processEvents()
+			end_message = NO_MORE_DATA if not self.lissa_checkbox.isChecked() else None
+			pbar, label = self.worker.progress_bar('wikipedia'), self.worker.progress_label('wikipedia')
 			if self.text:
 				if not textInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'Wikipedia Error', "Be sure to use a search available in the suggestions if wikipedia search is enabled", QMessageBox.Ok, QMessageBox.Ok)
-				elif asyncio.run(wiki_text.launch(self.search, self.fileName, self.openType, self.meshTree, self.progress_bar, self.wiki_progress_label, self.french_checkbox.isChecked(), self.english_checkbox.isChecked())) == False and not self.lissa_checkbox.isChecked():
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
-
+					return
+				self.worker.add_job('wikipedia', wiki_text.launch, self.search, self.fileName, self.openType, self.meshTree, pbar, label, self.french_checkbox.isChecked(), self.english_checkbox.isChecked(), sink=self.sink, end_message=end_message)
 			elif self.mesh :
 				if not meshInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'Wikipedia Error', "Be sure to use a mesh code available in the suggestions", QMessageBox.Ok, QMessageBox.Ok)
+					return
 				elif self.depths != "" and self.depths >= 0:
-					if asyncio.run(wiki_mesh_code.launch(self.search, self.depths, self.fileName, self.openType, self.meshTree, self.progress_bar, self.wiki_progress_label, self.french_checkbox.isChecked(), self.english_checkbox.isChecked())) == False and not self.lissa_checkbox.isChecked():
-						QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					self.worker.add_job('wikipedia', wiki_mesh_code.launch, self.search, self.depths, self.fileName, self.openType, self.meshTree, pbar, label, self.french_checkbox.isChecked(), self.english_checkbox.isChecked(), sink=self.sink, end_message=end_message)
 				else:
 					QMessageBox.question(self, 'Wikipedia Error', "Depth input is wrong", QMessageBox.Ok, QMessageBox.Ok)
+					return
 			elif self.uniqueID:
 				if not uiInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'Wikipedia Error', "Be sure to use a unique ID available in the suggestions", QMessageBox.Ok, QMessageBox.Ok)
-				elif asyncio.run(wiki_unique_id.launch(self.search, self.fileName, self.openType, self.meshTree, self.progress_bar, self.wiki_progress_label, self.french_checkbox.isChecked(), self.english_checkbox.isChecked())) == False and not self.lissa_checkbox.isChecked():
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					return
+				self.worker.add_job('wikipedia', wiki_unique_id.launch, self.search, self.fileName, self.openType, self.meshTree, pbar, label, self.french_checkbox.isChecked(), self.english_checkbox.isChecked(), sink=self.sink, end_message=end_message)
+			self.wiki_progress_label.setText("WIKIPEDIA --- /%")
 		elif self.wiki_checkbox.isChecked():
 			QMessageBox.question(self, 'Wikipedia Error', "One or several of the input given for wikipedia search is/are wrong", QMessageBox.Ok, QMessageBox.Ok)
 
 	def lissa_data_gathering(self):
 		"""
-		Gather data from LiSSa based on user inputs and selected options.
+		Queue the retrieval of data from LiSSa based on user inputs and selected options.
 
-		This method handles the gathering of data from LiSSa. It validates the input parameters 
-		and triggers data gathering accordingly. It also updates progress labels and displays 
+		This method validates the input parameters and adds the LiSSa retrieval to the 
+		worker accordingly. It also updates progress labels and displays 
 		appropriate error messages if needed.
 		"""
 		if self.lissa_checkbox.isChecked() and self.search != "" and self.fileName != "" and self.nbIdLissa != "" and self.nbPageLissa != "":
-			self.progress_bar.setValue(0)
-			self.lissa_progress_label.setText("LISSA --- /%")
-			QApplication.processEvents()
+			pbar, label = self.worker.progress_bar('lissa'), self.worker.progress_label('lissa')
 			if self.text:
 				if not textInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'LiSSa Error', "Be sure to use a search available in the suggestions if LiSSa search is enabled", QMessageBox.Ok, QMessageBox.Ok)
-				elif LiSSaReqText(self.search, self.fileName, self.nbPageLissa, self.nbIdLissa, self.meshTree, self.progress_bar, self.lissa_progress_label) == False:
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					return
+				self.worker.add_job('lissa', LiSSaReqText, self.search, self.fileName, self.nbPageLissa, self.nbIdLissa, self.meshTree, pbar, label, self.openType, self.sink, end_message=NO_MORE_DATA)
 			elif self.mesh :
 				if not meshInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'LiSSa Error', "Be sure to use a search available in the suggestions if LiSSa search is enabled", QMessageBox.Ok, QMessageBox.Ok)
-				elif LiSSaReqMesh(self.search, self.fileName, self.nbPageLissa, self.nbIdLissa, self.depths, self.meshTree, self.progress_bar, self.lissa_progress_label) == False:
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					return
+				self.worker.add_job('lissa', LiSSaReqMesh, self.search, self.fileName, self.nbPageLissa, self.nbIdLissa, self.depths, self.meshTree, pbar, label, self.openType, self.sink, end_message=NO_MORE_DATA)
 			elif self.uniqueID:
 				if not uiInData(self.search, self.meshTree):
 					QMessageBox.question(self, 'LiSSa Error', "Be sure to use a search available in the suggestions if LiSSa search is enabled", QMessageBox.Ok, QMessageBox.Ok)
-				elif LiSSaReqUI(self.search, self.fileName, self.nbPageLissa, self.nbIdLissa, self.meshTree, self.progress_bar, self.lissa_progress_label) == False:
-					QMessageBox.question(self, 'End', "There is no more data for this research", QMessageBox.Ok, QMessageBox.Ok)
+					return
+				self.worker.add_job('lissa', LiSSaReqUI, self.search, self.fileName, self.nbPageLissa, self.nbIdLissa, self.meshTree, pbar, label, self.openType, self.sink, end_message=NO_MORE_DATA)
+			self.lissa_progress_label.setText("LISSA --- /%")
 		elif self.lissa_checkbox.isChecked():
 			QMessageBox.question(self, 'LiSSa Error', "One or several of the input given for LiSSa search is/are wrong", QMessageBox.Ok, QMessageBox.Ok)
 
@@ -668,9 +681,10 @@ class MainWindow(QMainWindow):
 		"""
 		Handle the click event of the gather button.
 
-		This method is triggered when the gather button is clicked. It hides the gather button, 
-		shows the progress bar, retrieves input values, validates search inputs, triggers data 
-		gathering methods, hides the progress bar after data gathering, and shows the gather button again.
+		This method is triggered when the gather button is clicked. It retrieves input values, 
+		validates search inputs and queues the data gathering of each source on a retrieval 
+		worker. The worker runs the sources concurrently off the GUI thread; the gather button 
+		is hidden and the progress bar of each source shown until it is done.
 		"""
 		
 		self.inputs_values()
@@ -679,19 +693,60 @@ class MainWindow(QMainWindow):
 		if self.wiki_checkbox.isChecked() and self.text and not textInData(self.search, self.meshTree):
 			QMessageBox.question(self, 'Wikipedia Error', "Be sure to use a search available in the suggestions if wikipedia search is enabled", QMessageBox.Ok, QMessageBox.Ok)
 			return
-		
-		self.gather_button.hide()
 
-		self.progress_bar.show()
+		self.worker = RetrievalWorker(self)
+		self.worker.progress.connect(self.set_progress_value)
+		self.worker.label.connect(self.set_progress_label)
+		self.worker.message.connect(self.show_message)
+		self.worker.error.connect(self.show_error)
+		self.worker.finished.connect(self.on_finished)
 		
 		self.pubmed_data_gathering()
 
 		self.wikipedia_data_gathering()
 		
 		self.lissa_data_gathering()
+
+		if not self.worker.jobs:
+			self.on_finished()
+			return
 		
-		self.progress_bar.hide()
-		self.progress_bar.setValue(0)
+		self.gather_button.hide()
+
+		for source, progress_bar in self.progress_bars().items():
+			if any(job[0] == source for job in self.worker.jobs):
+				progress_bar.show()
+
+		self.worker.start()
+
+	def progress_bars(self):
+		return {'pubmed': self.pubmed_progress_bar, 'wikipedia': self.wiki_progress_bar, 'lissa': self.lissa_progress_bar}
+
+	def set_progress_value(self, source, value):
+		"""
+		Show the progress a retrieval emitted in the progress bar of its source.
+		"""
+		self.progress_bars()[source].setValue(value)
+
+	def set_progress_label(self, source, text):
+		"""
+		Show the progress text a retrieval emitted in the label of its source.
+		"""
+		{'pubmed': self.pubmed_progress_label, 'wikipedia': self.wiki_progress_label, 'lissa': self.lissa_progress_label}[source].setText(text)
+
+	def show_message(self, title, text):
+		QMessageBox.question(self, title, text, QMessageBox.Ok, QMessageBox.Ok)
+
+	def show_error(self, source, text):
+		QMessageBox.question(self, f'{source} Error', text, QMessageBox.Ok, QMessageBox.Ok)
+
+	def on_finished(self):
+		"""
+		Reset the progress widgets and show the gather button again once the retrievals are done.
+		"""
+		for progress_bar in self.progress_bars().values():
+			progress_bar.hide()
+			progress_bar.setValue(0)
 		self.wiki_progress_label.setText("")
 		self.pubmed_progress_label.setText("")
 		self.lissa_progress_label.setText("")
@@ -0,0 +1,117 @@
+import csv
+import os
+import re
+
+# Columns of the per-level tables, after the code and the title
+ROLLUP_COLUMNS = ['documents', 'occurrences in titles', 'occurrences in abstracts', 'abstracts']
+
+def code_parent(code):
+    """
+    Gives the parent of a tree number, e.g. 'C14.280' for 'C14.280.647', or None for a top-level code.
+    """
+    return code.rsplit('.', 1)[0] if '.' in code else None
+
+def code_ancestors(code):
+    """
+    Gives a tree number and all its ancestors, e.g. 'C14.280.647', 'C14.280' and 'C14'.
+    """
+    ancestors = []
+    while code is not None:
+        ancestors.append(code)
+        code = code_parent(code)
+    return ancestors
+
+def branches(codes):
+    """
+    Gives the set of the nodes of the tree covered by tree numbers: the
+    numbers themselves and all their ancestors, each once.
+
+    Args:
+        codes (iterable of str): The tree numbers, e.g. 'C14.280.647'.
+
+    Returns:
+        set: The nodes.
+    """
+    return {ancestor for code in codes if code for ancestor in code_ancestors(code)}
+
+def branch_counts(meshTree, code_documents, ui_counts):
+    """
+    Gives the counts of every node of the tree with its descendants.
+
+    The documents come from the scans, which count a document once for each
+    node of its branches, however many of its codes are below the node. The
+    occurrences of the title of a unique ID are added once to each node of
+    the branches of its tree numbers, so a descriptor found at several places
+    of the tree is counted once at their common ancestors. The occurrences of
+    different unique IDs are added up, and so are their numbers of abstracts:
+    an abstract holding the titles of two unique IDs of a branch is counted
+    for each of them.
+
+    Args:
+        meshTree (list of str): List of mesh data from a file.
+        code_documents (dict): The number of documents of each node, from the scans.
+        ui_counts (dict): The occurrences in titles, in abstracts and number of abstracts of each unique ID.
+
+    Returns:
+        dict: The counts of each node, see ROLLUP_COLUMNS.
+    """
+    counts = {code: [documents, 0, 0, 0] for code, documents in code_documents.items() if documents}
+    uiCodes = {}
+    for line in meshTree:
+        fields = line.split("|")
+        if fields[3] in ui_counts:
+            uiCodes.setdefault(fields[3], []).append(fields[2])
+    for ui, codes in uiCodes.items():
+        for code in branches(codes):
+            total = counts.setdefault(code, [0, 0, 0, 0])
+            for i, value in enumerate(ui_counts[ui]):
+                total[i + 1] += value
+    return counts
+
+def write_level_tables(folder, name, rolled, code_titles):
+    """
+    Writes one '|' delimited table per depth of the tree: {name}_level_1.csv
+    for the top-level codes such as C14, {name}_level_2.csv for codes such as
+    C14.280, and so on.
+
+    Args:
+        folder (str): The folder of the tables.
+        name (str): The prefix of the tables.
+        rolled (dict): The counts of each node, from branch_counts.
+        code_titles (dict): The title of each tree number.
+
+    Returns:
+        list: The paths of the tables.
+    """
+    levels = {}
+    for code in sorted(rolled):
+        levels.setdefault(code.count('.') + 1, []).append([code, code_titles.get(code, '')] + rolled[code])
+    paths = []
+    for level, rows in sorted(levels.items()):
+        path = os.path.join(folder, f'{name}_level_{level}.csv')
+        with open(path, 'w', encoding="utf-8", newline='') as f:
+            writer = csv.writer(f, delimiter='|')
+            writer.writerow(['code', 'title'] + ROLLUP_COLUMNS)
+            writer.writerows(rows)
+        paths.append(path)
+    return paths
+
+def read_level_tables(folder):
+    """
+    Reads the per-level tables of a statistics folder, e.g. to show the counts in the MeSH tree.
+
+    Args:
+        folder (str): The statistics folder, e.g. 'stats/heart'.
+
+    Returns:
+        dict: The rolled up counts of each tree number.
+    """
+    rolled = {}
+    for filename in os.listdir(folder):
+        if re.search(r'_level_\d+\.csv$', filename):
+            with open(os.path.join(folder, filename), 'r', encoding="utf-8", newline='') as f:
+                rows = csv.reader(f, delimiter='|')
+                next(rows, None)
+                for row in rows:
+                    rolled[row[0]] = [int(value) for value in row[2:]]
+    return rolled
@@ -8,7 +8,7 @@ class MeshTree(QMainWindow):
     An interface for viewing MeSH (Medical Subject Headings) data in a hierarchical tree structure.
     """
 
-    def __init__(self, qline, text, mesh, uniqueid, meshTree):
+    def __init__(self, qline, text, mesh, uniqueid, meshTree, counts=None):
         """
         Initializes the MeshTree widget.
 
@@ -18,6 +18,8 @@ class MeshTree(QMainWindow):
         - mesh (bool): Indicates whether MeSH code display mode is selected.
         - uniqueid (bool): Indicates whether unique ID display mode is selected.
         - meshTree: MeSH tree data structure.
+        - counts (dict, optional): Rolled up counts of each MeSH code, from mesh_rollup.read_level_tables,
+          shown next to the names.
         """
         super().__init__()
         self.qline = qline
@@ -25,6 +27,7 @@ class MeshTree(QMainWindow):
         self.mesh = mesh
         self.uniqueid = uniqueid
         self.meshTree = meshTree
+        self.counts = counts or {}
         self.hierarchy = None
         self.model = None
         self.fr_or_en = 2
@@ -255,6 +258,10 @@ class MeshTree(QMainWindow):
             
             item_data = value.get('_data', ["", "", "", ""])
             display_text = f"{item_data[fr_or_en]} [{item_data[0]}]"
+            if item_data[0] in self.counts:
+                # The counts go before the code, which the click handler reads after the last '['
+                documents, in_titles, in_abstracts = self.counts[item_data[0]][:3]
+                display_text = f"{item_data[fr_or_en]} ({documents} docs, {in_titles + in_abstracts} occ.) [{item_data[0]}]"
             item = QStandardItem(display_text)
             item.setEditable(False)
             
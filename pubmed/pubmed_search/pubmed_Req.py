@@ -1,23 +1,17 @@
 import aiohttp
-import aiofiles
 import asyncio
 import calendar
 from bs4 import BeautifulSoup
-import csv
 import os
-from PyQt5.QtWidgets import QApplication
-import datetime
 
 from MeSH.meshData_func import titleToMesh, titleToUniqueID
-
-nb_tasks = 0
-nb_tasks_done = 0
-nb_tasks_failed = 0
-timeStart = 0
+from common.http_cache import cached_get
+from common.output_sink import open_sink
+from common.progress import ProgressTracker, ProgressReporter
 
 async def fetch(session, url):
     """
-    Fetches the content of the given URL.
+    Fetches the content of the given URL through the response cache.
 
     Parameters:
     session (aiohttp.ClientSession): The session to use for making the request.
@@ -26,10 +20,10 @@ async def fetch(session, url):
     Returns:
     str: The response text from the URL.
     """
-    async with session.get(url) as response:
-        return await response.text()
+    response = await cached_get(session, url, source='pubmed')
+    return response.text
 
-async def process_page(session, url, nbId, writer, meshTree, pbar, pubmedProgressBar):
+async def process_page(session, url, nbId, writer, meshTree, progress):
     """
     Processes a single page of search results from PubMed.
 
@@ -37,17 +31,13 @@ async def process_page(session, url, nbId, writer, meshTree, pbar, pubmedProgres
     session (aiohttp.ClientSession): The session to use for making the request.
     url (str): The URL of the page to process.
     nbId (int): The number of IDs to process.
-    writer (csv.writer): The CSV writer to write the results.
+    writer: The output sink to write the results.
     meshTree (list): The mesh data to use for finding codes and unique IDs.
-    pbar (QProgressBar): The progress bar to update.
-    pubmedProgressBar (QLabel): The progress label to update.
+    progress (ProgressTracker): The progress of the run, one task per ID.
 
     Returns:
     None
     """
-    global nb_tasks_done
-    global nb_tasks
-    global nb_tasks_failed
     response_text = await fetch(session, url)
     try :
         soup = BeautifulSoup(response_text, 'lxml')
@@ -78,47 +68,32 @@ async def process_page(session, url, nbId, writer, meshTree, pbar, pubmedProgres
                             
                         a = line[-1]
 
-                update_progress_bar(pbar, pubmedProgressBar, 1, 0)
+                progress.advance(done=1)
                 if 'TI' in dictList[i] and 'AB' in dictList[i] and dictList[i]['AB'] != "" and 'MH' in dictList[i]:
                     meshcodes = titleToMesh([title.split("/")[0] for title in dictList[i]['MH'].split(";")], meshTree)
                     uniqueID = titleToUniqueID([title.split("/")[0] for title in dictList[i]['MH'].split(";")], meshTree)
                     await writer.writerow([url, ";".join(meshcodes), ";".join(uniqueID), dictList[i]['TI'], dictList[i]['AB']])
             else:
-                update_progress_bar(pbar, pubmedProgressBar, 0, nbId - i)
+                progress.advance(failed=nbId - i)
                 break
     else:
-        update_progress_bar(pbar, pubmedProgressBar, 0, nbId)
+        progress.advance(failed=nbId)
 
 
-def update_progress_bar(pbar, pubmedProgressBar, nbIdDone, nbIdFailed):
+def request_tasks(nbId, nbPage):
     """
-    Updates the progress bar and label for the PubMed request process.
+    Gives the number of IDs a request asks for: nbId per page, nbPage pages for each half of the 12 months.
 
     Parameters:
-    pbar (QProgressBar): The progress bar to update.
-    pubmedProgressBar (QLabel): The label to display progress text.
-    nbId (int): The number of IDs processed.
+    nbId (int): The number of IDs per page to fetch.
+    nbPage (int): The number of pages to fetch.
 
     Returns:
-    None
+    int: The number of tasks of the request.
     """
-    global nb_tasks
-    global nb_tasks_done
-    global nb_tasks_failed
-
-    a_timedelta = datetime.datetime.now() - timeStart
-    seconds = a_timedelta.total_seconds()
-    nb_tasks_done += nbIdDone
-    nb_tasks_failed += nbIdFailed
-    if (nb_tasks-nb_tasks_failed) != 0:
-        pbar.setValue(int(nb_tasks_done/(nb_tasks-nb_tasks_failed)*100))
-        pubmedProgressBar.setText(f"PUBMED {int(nb_tasks_done/(nb_tasks-nb_tasks_failed)*100)}% ({nb_tasks_done}/{nb_tasks-nb_tasks_failed}) {int(seconds / 60)}m {int(seconds % 60)}s")
-    else:
-        pbar.setValue(int(nb_tasks_done/(nb_tasks-nb_tasks_failed)*100))
-        pubmedProgressBar.setText(f"PUBMED 0% (0/0) {int(seconds / 60)}m {int(seconds % 60)}s")
-    QApplication.processEvents()
+    return 12 * 2 * nbPage * nbId
 
-async def Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar, nb_tasks__done=0, nb__tasks=1, max_concurrent_requests=40):
+async def Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar, max_concurrent_requests=40, sink='csv', progress=None):
     """
     Performs asynchronous requests to PubMed and processes the search results.
 
@@ -133,22 +108,20 @@ async def Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree,
     meshTree (list): The mesh data to use for finding codes and unique IDs.
     pbar (QProgressBar): The progress bar to update.
     pubmedProgressBar (QLabel): The progress label to update.
-    nb_tasks__done (int): The number of tasks already done.
-    nb__tasks (int): The total number of tasks.
     max_concurrent_requests (int): The maximum number of concurrent requests.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
+    progress (ProgressTracker): The progress of a run of several requests, which
+                                reports it and counts their tasks. By default the
+                                request is a run of its own.
 
     Returns:
     None
     """
-    global nb_tasks
-    global nb_tasks_done
-    global nb_tasks_failed
-    global timeStart
-    if nb_tasks__done == 0:
-        nb_tasks_failed = 0
-        timeStart = datetime.datetime.now()
-    nb_tasks = nb__tasks
-    nb_tasks_done = nb_tasks__done
+    if progress is None:
+        progress = ProgressTracker('PUBMED', request_tasks(nbId, nbPage))
+        async with ProgressReporter(progress, pbar, pubmedProgressBar):
+            return await Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar,
+                             max_concurrent_requests, sink, progress)
     search = search.replace(" ", "+")
     tasks = []
     connector = aiohttp.TCPConnector(limit_per_host=max_concurrent_requests)
@@ -156,13 +129,10 @@ async def Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree,
         if not os.path.exists('pubmed/pubmed_data/'):
             # Create the directory if not existing
             os.makedirs('pubmed/pubmed_data/')
-        async with aiofiles.open(f'pubmed/pubmed_data/{fileName}_pubmed_en.csv', openType, encoding="utf-8", newline='') as file:
-            writer = csv.writer(file, delimiter='|')
+        async with open_sink(sink, f'pubmed/pubmed_data/{fileName}_pubmed_en', openType) as writer:
             bold = '\033[1m'
             end = '\033[0m'
             underline = '\033[4m'
-            nb_tasks = nb_tasks * 12 * 2 * (nbPage-nbPageMin+1) * nbId
-            nb_tasks_done = nb_tasks_done * 12 * 2 * (nbPage-nbPageMin+1) * nbId - nb_tasks_failed
             for m in range(1, 13):
                 print(f"{bold}{underline}PUBMED :{end}{bold} {search.split('[')[0].replace('+', ' ')}{end} data search for {bold}{calendar.month_name[m]}{end}... ✓")
                 
@@ -175,7 +145,7 @@ async def Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree,
                         _, nbOfDays = calendar.monthrange(y, m)
                     for j in range(nbPageMin, nbPageMin + nbPage):
                         url = f"https://pubmed.ncbi.nlm.nih.gov/?term={search}&filter=simsearch1.fha&filter=dates.{y}%2F{m}%2F{firstDay}-{y}%2F{m}%2F{nbOfDays}&sort=date&format=pubmed&page={j}&size={nbId}"
-                        tasks.append(process_page(session, url, nbId, writer, meshTree, pbar, pubmedProgressBar))
+                        tasks.append(process_page(session, url, nbId, writer, meshTree, progress))
 
                         if len(tasks) >= max_concurrent_requests:
                             await asyncio.gather(*tasks)
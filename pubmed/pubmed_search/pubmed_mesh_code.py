@@ -1,9 +1,8 @@
-import asyncio
-
-from pubmed.pubmed_search.pubmed_Req import Req
+from pubmed.pubmed_search.pubmed_Req import Req, request_tasks
+from common.progress import ProgressTracker, ProgressReporter
 from MeSH.meshData_func import depthMeshEnglishTitle
 
-def ReqMesh(nbId, nbPage, nbPageMin, search, fileName, y, depth, openType, meshTree, pbar, pubmedProgressBar):
+async def ReqMesh(nbId, nbPage, nbPageMin, search, fileName, y, depth, openType, meshTree, pbar, pubmedProgressBar, sink='csv'):
     """
     Runs PubMed requests using MeSH terms generated by depthMesh.
 
@@ -22,17 +21,21 @@ def ReqMesh(nbId, nbPage, nbPageMin, search, fileName, y, depth, openType, meshT
     meshTree (list): The mesh data to use for finding codes and unique IDs.
     pbar: The progress bar object for tracking progress.
     pubmedProgressBar: The progress bar for PubMed requests.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     bool: Always returns False (could be used for error handling or future expansion).
     """
     # Generate a list of titles based on the depth in the MeSH tree
     titleList = depthMeshEnglishTitle(search, depth, meshTree)
-    # Loop through the titles and perform PubMed requests
-    for i, title in enumerate(titleList):
-        # Determine the file open mode based on the iteration
-        current_open_type = openType if i == 0 else 'a'
+    # One progress for all the requests
+    progress = ProgressTracker('PUBMED', len(titleList) * request_tasks(nbId, nbPage))
+    async with ProgressReporter(progress, pbar, pubmedProgressBar):
+        # Loop through the titles and perform PubMed requests
+        for i, title in enumerate(titleList):
+            # Determine the file open mode based on the iteration
+            current_open_type = openType if i == 0 else 'a'
 
-        asyncio.run(Req(nbId, nbPage, nbPageMin, title+"[MeSH Terms]", fileName, y, current_open_type, meshTree, pbar, pubmedProgressBar, i, len(titleList)))
+            await Req(nbId, nbPage, nbPageMin, title+"[MeSH Terms]", fileName, y, current_open_type, meshTree, pbar, pubmedProgressBar, sink=sink, progress=progress)
 
     return False
\ No newline at end of file
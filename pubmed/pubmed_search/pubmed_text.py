@@ -1,8 +1,6 @@
-import asyncio
-
 from pubmed.pubmed_search.pubmed_Req import Req
 
-def ReqText(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar):
+async def ReqText(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar, sink='csv'):
     """
     Runs the PubMed request using asyncio to fetch and process data.
 
@@ -17,10 +15,11 @@ def ReqText(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pb
     meshTree (list): The mesh data to use for finding codes and unique IDs.
     pbar (QProgressBar): The progress bar to update.
     pubmedProgressBar (QLabel): The progress label to update.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     bool: Always returns False (could be used for error handling or future expansion).
     """
-    asyncio.run(Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar))
+    await Req(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar, sink=sink)
     
     return False
\ No newline at end of file
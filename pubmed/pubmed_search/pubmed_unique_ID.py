@@ -1,8 +1,6 @@
-import asyncio
-
 from pubmed.pubmed_search.pubmed_Req import Req
 
-def ReqUI(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar):
+async def ReqUI(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar, pubmedProgressBar, sink='csv'):
     """
     Runs a PubMed request using a search term to find a corresponding MeSH term and fetches data based on it.
 
@@ -17,6 +15,7 @@ def ReqUI(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar
     meshTree (list): The mesh data to use for finding MeSH terms.
     pbar (QProgressBar): The progress bar to update.
     pubmedProgressBar (QLabel): The progress label to update.
+    sink (str): The output format, e.g. 'csv' or 'parquet'.
 
     Returns:
     bool: Always returns False. Could be used for error handling or future expansion.
@@ -33,6 +32,6 @@ def ReqUI(nbId, nbPage, nbPageMin, search, fileName, y, openType, meshTree, pbar
     
     # If a MeSH term is found, run the asynchronous request
     if title:
-        asyncio.run(Req(nbId, nbPage, nbPageMin, title+"[MeSH Terms]", fileName, y, openType, meshTree, pbar, pubmedProgressBar))
+        await Req(nbId, nbPage, nbPageMin, title+"[MeSH Terms]", fileName, y, openType, meshTree, pbar, pubmedProgressBar, sink=sink)
 
     return False
\ No newline at end of file
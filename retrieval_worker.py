@@ -0,0 +1,151 @@
+import asyncio
+import traceback
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Names of the sources in the error messages
+SOURCE_NAMES = {'pubmed': 'PubMed', 'wikipedia': 'Wikipedia', 'lissa': 'LiSSa'}
+
+class SignalProgressBar:
+    """
+    Stands for the progress bar of a source in the search modules: setValue
+    emits the value to the GUI thread instead of touching the widget.
+    """
+
+    def __init__(self, signal, source):
+        self.signal = signal
+        self.source = source
+
+    def setValue(self, value):
+        self.signal.emit(self.source, int(value))
+
+class SignalLabel:
+    """
+    Stands for a progress label of a source in the search modules: setText
+    emits the text to the GUI thread instead of touching the widget.
+    """
+
+    def __init__(self, signal, source):
+        self.signal = signal
+        self.source = source
+
+    def setText(self, text):
+        self.signal.emit(self.source, text)
+
+class RetrievalWorker(QThread):
+    """
+    Runs the retrievals on a thread of its own, with its own event loop, so
+    that the GUI thread only repaints the widgets and the event loop of the
+    retrievals only waits for the network.
+
+    The sources run concurrently on the loop, so a run takes about as long as
+    its slowest source; the retrievals of a same source run one after another,
+    in the order they were added. Each source keeps its own HTTP session and
+    per-host connection limit (max_concurrent_requests of PubMed and LiSSa,
+    MAX_CONNECTIONS_PER_HOST of Wikipedia), so a slow source does not hold
+    back the requests of the others.
+
+    The retrievals report to the GUI through signals: progress for the
+    progress bar of a source, label for its progress label, message for the
+    end of the data of a search and error for a retrieval that failed.
+    QThread.finished is emitted once all of them are done.
+    """
+
+    progress = pyqtSignal(str, int)
+    label = pyqtSignal(str, str)
+    message = pyqtSignal(str, str)
+    error = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = []
+        self.loop = None
+        self.task = None
+
+    def progress_bar(self, source):
+        """
+        Gives the stand-in of the progress bar of a source, to pass to the search modules.
+
+        Args:
+            source (str): 'pubmed', 'wikipedia' or 'lissa'.
+
+        Returns:
+            SignalProgressBar: The progress bar.
+        """
+        return SignalProgressBar(self.progress, source)
+
+    def progress_label(self, source):
+        """
+        Gives the stand-in of the progress label of a source, to pass to the search modules.
+
+        Args:
+            source (str): 'pubmed', 'wikipedia' or 'lissa'.
+
+        Returns:
+            SignalLabel: The label.
+        """
+        return SignalLabel(self.label, source)
+
+    def add_job(self, source, coroutine_function, *args, end_message=None, **kwargs):
+        """
+        Adds a retrieval to run, after the ones already added.
+
+        Args:
+            source (str): 'pubmed', 'wikipedia' or 'lissa'.
+            coroutine_function: The retrieval, e.g. ReqText or wiki_text.launch.
+            *args, **kwargs: Its arguments.
+            end_message (str): The message to show if the retrieval returns False, None for no message.
+        """
+        self.jobs.append((source, coroutine_function, args, kwargs, end_message))
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.task = self.loop.create_task(self.run_jobs())
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+            self.loop = None
+
+    async def run_jobs(self):
+        sources = {}
+        for job in self.jobs:
+            sources.setdefault(job[0], []).append(job)
+        await asyncio.gather(*[self.run_source(source, jobs) for source, jobs in sources.items()])
+
+    async def run_source(self, source, jobs):
+        """
+        Runs the retrievals of a source one after another.
+
+        Args:
+            source (str): 'pubmed', 'wikipedia' or 'lissa'.
+            jobs (list): The retrievals of the source, see add_job.
+        """
+        for _, coroutine_function, args, kwargs, end_message in jobs:
+            self.progress.emit(source, 0)
+            try:
+                result = await coroutine_function(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                self.error.emit(SOURCE_NAMES.get(source, source), f"{type(e).__name__}: {e}")
+                continue
+            if result == False and end_message is not None:
+                self.message.emit('End', end_message)
+
+    def stop(self):
+        """
+        Cancels the running retrieval from the GUI thread. The outputs are
+        closed as on any cancellation, so the rows already retrieved are kept.
+        """
+        loop, task = self.loop, self.task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # The loop closed meanwhile, the retrievals are already done
+                pass
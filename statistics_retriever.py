@@ -4,6 +4,7 @@ import os
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QListWidget, QLabel, QListWidgetItem, QLineEdit, QMessageBox
 from PyQt5.QtGui import QIcon
 from stats import stats
+from common.compressed_io import is_csv_output
 
 class FileSelector(QWidget):
     """
@@ -68,7 +69,7 @@ class FileSelector(QWidget):
 
     def populateFileList(self, folders):
         """
-        Populates the file_list widget with CSV files from selected folders.
+        Populates the file_list widget with CSV files, compressed or not, from selected folders.
 
         Args:
         - folders (list): List of folder paths from which to populate CSV files.
@@ -77,10 +78,15 @@ class FileSelector(QWidget):
         for folder in folders:
             for filename in os.listdir(folder):
                 file_path = os.path.join(folder, filename)
-                if os.path.isfile(file_path) and filename.endswith(".csv"):
+                if os.path.isfile(file_path) and is_csv_output(filename):
                     file_item = QListWidgetItem(QIcon("images/csv_icon.png"), f"{filename} ({folder})")
                     self.file_list.addItem(file_item)
                     file_item.setData(1000, file_path) 
+                elif os.path.isfile(file_path) and filename.endswith(".manifest.json"):
+                    # A sharded output, whose shards are processed together
+                    file_item = QListWidgetItem(QIcon("images/folder_icon.png"), f"{filename} ({folder})")
+                    self.file_list.addItem(file_item)
+                    file_item.setData(1000, file_path) 
 
     def selectFiles(self):
         """
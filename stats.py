@@ -2,8 +2,17 @@ import aiofiles
 import aiofiles.os
 import asyncio
 import csv
+import os
 from os.path import exists
-from MeSH.meshData_func import UniqueIDToTitle, UniqueIDToFrenchTitle
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+import cooccurrence
+import mesh_rollup
+from common.aho_corasick import TermCounter
+from common.compressed_io import open_text
+from common.output_sink import manifest_files
+from common.stats_cache import StatsCache, file_digests
 
 async def read_file(file_path):
     """
@@ -33,67 +42,433 @@ async def write_file(file_path, data):
         for line in data:
             await writer.writerow(line)
 
-async def process_file(file, meshTree):
+# Files bigger than this are counted in chunks of rows spread over the process pool
+CHUNK_FILE_BYTES = 64 * 1024 * 1024
+CHUNK_ROWS = 20000
+
+# Chunks of a file submitted to the process pool and not counted yet, about two per worker
+CHUNKS_IN_FLIGHT = 2 * (os.cpu_count() or 1)
+
+def file_language(file):
     """
-    Asynchronously processes a CSV file, extracting and analyzing data.
+    Gives the language of an output file from its name, e.g. 'heart_pubmed_en.csv'.
+
+    Args:
+        file (str): Path to the file.
+
+    Returns:
+        str: 'en', 'fr' or the last part of the name.
+    """
+    return file.split(".")[0].split("_")[-1]
+
+def unique_id_titles(meshTree, language):
+    """
+    Maps every unique ID of the MeSH tree to its lowercased title, in one scan of the tree.
+
+    Args:
+        meshTree (list of str): List of mesh data from a file.
+        language (str): 'en' for the English titles, 'fr' for the French ones.
+
+    Returns:
+        dict: The title of each unique ID.
+    """
+    column = 1 if language == 'en' else 0
+    titles = {}
+    for line in meshTree:
+        fields = line.split("|")
+        titles.setdefault(fields[3], fields[column].lower())
+    return titles
+
+def byte_lines(f, end=None):
+    """
+    Decodes the lines of a binary file up to a byte offset, which must be at the end of a row.
+    """
+    position = f.tell()
+    for line in f:
+        if end is not None and position >= end:
+            return
+        position += len(line)
+        yield line.decode('utf-8')
+
+def read_rows(file, start=0, end=None):
+    """
+    Streams the rows of a CSV file.
+
+    Args:
+        file (str): Path to the CSV file, optionally gzip (.csv.gz) or zstd (.csv.zst) compressed.
+        start (int): Byte offset of the first row, for uncompressed files.
+        end (int): Byte offset after the last row, for uncompressed files.
+
+    Yields:
+        list: The rows.
+    """
+    if start == 0 and end is None:
+        with open_text(file) as f:
+            yield from csv.reader(f, delimiter='|')
+        return
+    with open(file, 'rb') as f:
+        f.seek(start)
+        yield from csv.reader(byte_lines(f, end), delimiter='|')
+
+def scan_file(file, start=0, end=None):
+    """
+    Counts the documents and words of a CSV file, collects its unique IDs and
+    counts the documents of each node of the MeSH tree: a document is counted
+    once for every node of the branches of its tree numbers, however many of
+    its tree numbers are below the node. The unique IDs of each document are
+    kept too, for the co-occurrence matrix.
+
+    The word counts are those of the original space-joined titles and
+    abstracts, kept as the number of separators so that the counts of
+    several files or shards can be added: one per space plus one per row.
+
+    Args:
+        file (str): Path to the CSV file, optionally gzip (.csv.gz) or zstd (.csv.zst) compressed.
+        start (int): Byte offset of the first row, for uncompressed files.
+        end (int): Byte offset after the last row, for uncompressed files.
+
+    Returns:
+        tuple: The number of documents, the title and abstract separators, the
+               set of unique IDs, the number of documents of each node and the
+               unique id column of each document.
+    """
+    nbDocuments = 0
+    titleSeparators = 0
+    abstractSeparators = 0
+    fileUis = set()
+    codeDocuments = {}
+    documents = []
+    for row in read_rows(file, start, end):
+        nbDocuments += 1
+        fileUis.update(row[2].split(";"))
+        documents.append(row[2])
+        for code in mesh_rollup.branches(row[1].split(";")):
+            codeDocuments[code] = codeDocuments.get(code, 0) + 1
+        titleSeparators += row[3].count(" ") + 1
+        abstractSeparators += row[4].count(" ") + 1
+    return (nbDocuments, titleSeparators, abstractSeparators, fileUis, codeDocuments, documents)
+
+def merge_scans(scans):
+    """
+    Adds up the scans of several files or shards.
+
+    Args:
+        scans (list): The results of scan_file.
+
+    Returns:
+        tuple: The merged scan.
+    """
+    codeDocuments = {}
+    for scan in scans:
+        for code, documents in scan[4].items():
+            codeDocuments[code] = codeDocuments.get(code, 0) + documents
+    return (sum(scan[0] for scan in scans), sum(scan[1] for scan in scans), sum(scan[2] for scan in scans), set().union(*[scan[3] for scan in scans]), codeDocuments,
+            [document for scan in scans for document in scan[5]])
+
+def scan_stats(name, scan):
+    """
+    Gives the statistics line of a scan: name, documents, title words, abstract words and total words.
+    """
+    nbDocuments, titleSeparators, abstractSeparators = scan[:3]
+    return [name, nbDocuments, titleSeparators + 1, abstractSeparators + 1, titleSeparators + abstractSeparators + 1]
+
+@lru_cache(maxsize=4)
+def term_counter(titles, word_boundaries):
+    # Kept per worker process, so that the automaton of a file is built once for all its chunks
+    return TermCounter(list(titles), word_boundaries)
+
+def count_titles(texts, titles, word_boundaries=False):
+    """
+    Counts the occurrences of MeSH titles in documents.
+
+    Args:
+        texts (iterable): The title and abstract of each document.
+        titles (tuple of str): The titles to count.
+        word_boundaries (bool): Only count the titles found as whole words.
+
+    Returns:
+        dict: The occurrences in the titles, in the abstracts and the number of abstracts of each title found.
+    """
+    counter = term_counter(titles, word_boundaries)
+    counts = {}
+    for title_text, abstract_text in texts:
+        for title, inTitle in counter.count(title_text).items():
+            counts.setdefault(title, [0, 0, 0])[0] += inTitle
+        for title, inAbstract in counter.count(abstract_text).items():
+            count = counts.setdefault(title, [0, 0, 0])
+            count[1] += inAbstract
+            count[2] += 1
+    return counts
+
+def count_titles_in_file(file, titles, word_boundaries=False, start=0, end=None):
+    """
+    Counts the occurrences of MeSH titles in the documents of a CSV file, or
+    of a range of bytes of it, see count_titles.
+    """
+    return count_titles(((row[3], row[4]) for row in read_rows(file, start, end)), titles, word_boundaries)
+
+def merge_counts(parts):
+    """
+    Adds up the title counts of several files, shards or chunks.
+
+    Args:
+        parts (list): The results of count_titles.
+
+    Returns:
+        dict: The merged counts.
+    """
+    merged = {}
+    for part in parts:
+        for title, count in part.items():
+            total = merged.setdefault(title, [0] * len(count))
+            for i, value in enumerate(count):
+                total[i] += value
+    return merged
+
+def data_lines(uilists, titles, counts):
+    """
+    Gives one data line per unique ID: title, occurrences in the titles, in the abstracts and number of abstracts.
+    """
+    return [[titles[ui]] + counts.get(titles[ui], [0, 0, 0]) for ui in uilists if ui in titles]
+
+def count_file(file, meshTree, uilists=None, word_boundaries=False):
+    """
+    Counts the documents and words of a CSV file and the occurrences of the
+    Mesh titles of its unique IDs, in the current process.
+
+    The file is streamed twice, once for the documents, words and unique IDs
+    and once for the titles, with running counters, so memory does not grow
+    with the size of the file. All the titles are matched together with an
+    Aho-Corasick automaton.
+
+    Args:
+        file (str): Path to the CSV file, optionally gzip (.csv.gz) or zstd (.csv.zst) compressed.
+        meshTree (list of str): List of mesh data from a file.
+        uilists (set): The unique IDs whose titles are counted, those of the file by default.
+        word_boundaries (bool): Only count the titles found as whole words.
+
+    Returns:
+        tuple: The statistics of the file and the unfiltered data lines.
+    """
+    scan = scan_file(file)
+    if uilists is None:
+        uilists = scan[3]
+    titles = unique_id_titles(meshTree, file_language(file)) if file_language(file) in ('en', 'fr') else {}
+    selected = tuple(dict.fromkeys(titles[ui] for ui in uilists if ui in titles))
+    counts = count_titles_in_file(file, selected, word_boundaries) if selected else {}
+    return (scan_stats(file, scan), data_lines(uilists, titles, counts))
+
+def filter_lines(lines):
+    """
+    Sorts the data lines by occurrences and drops the titles missing from either the titles or the abstracts.
+
+    Args:
+        lines (list): The data lines of count_file.
+
+    Returns:
+        list: The filtered data lines.
+    """
+    lines.sort(key=lambda l: (l[2], l[1]), reverse=True)
+    return [line for line in lines if line[1] != 0 and line[2] != 0]
+
+async def count_titles_in_pool(file, titles, word_boundaries, pool, start=0, end=None):
+    """
+    Counts the occurrences of MeSH titles in a CSV file, or in a range of
+    bytes of it, on the process pool, in chunks of CHUNK_ROWS rows if it is
+    bigger than CHUNK_FILE_BYTES. At most CHUNKS_IN_FLIGHT chunks are read
+    ahead of the workers, the next ones being read as they are counted, so
+    memory does not grow with the size of the file.
+
+    Args:
+        file (str): Path to the CSV file.
+        titles (tuple of str): The titles to count.
+        word_boundaries (bool): Only count the titles found as whole words.
+        pool (ProcessPoolExecutor): The process pool.
+        start (int): Byte offset of the first row, for uncompressed files.
+        end (int): Byte offset after the last row, for uncompressed files.
+
+    Returns:
+        dict: The counts, see count_titles.
+    """
+    loop = asyncio.get_running_loop()
+    if (os.path.getsize(file) if end is None else end) - start <= CHUNK_FILE_BYTES:
+        return await loop.run_in_executor(pool, count_titles_in_file, file, titles, word_boundaries, start, end)
+    rows = read_rows(file, start, end)
+
+    def next_chunk():
+        return [(row[3], row[4]) for row in islice(rows, CHUNK_ROWS)]
+
+    counts = {}
+    pending = set()
+    chunk = await asyncio.to_thread(next_chunk)
+    while chunk or pending:
+        while chunk and len(pending) < CHUNKS_IN_FLIGHT:
+            pending.add(loop.run_in_executor(pool, count_titles, chunk, titles, word_boundaries))
+            chunk = await asyncio.to_thread(next_chunk)
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        counts = merge_counts([counts] + [part.result() for part in done])
+    return counts
+
+def ends_with_row(file, size):
+    """
+    Checks whether the first bytes of a file end at the end of a row, so that rows can be read after them.
+    """
+    if size == 0:
+        return True
+    with open(file, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+async def scan_summary(file, summary, pool):
+    """
+    Brings the scan of a file up to date with its cached summary: an
+    unchanged file (same size and modification time) is not read, a CSV file
+    whose previous content is unchanged (same SHA-256) is only scanned after
+    it, in the bytes appended since, as when a retrieval appends to it, and
+    any other file is scanned again.
 
     Args:
         file (str): Path to the CSV file.
+        summary (dict): The cached summary of the file, or None.
+        pool (ProcessPoolExecutor): The process pool.
+
+    Returns:
+        tuple: The updated summary and the byte offset from which the titles
+               have to be counted again.
+    """
+    loop = asyncio.get_running_loop()
+    status = os.stat(file)
+    if summary is not None and summary['size'] == status.st_size and summary['mtime'] == status.st_mtime_ns:
+        return summary, status.st_size
+    # The file is only read up to its current size, rows appended meanwhile are left for the next run
+    end = status.st_size if file.endswith('.csv') else None
+    if summary is not None and end is not None and summary['size'] <= end and ends_with_row(file, summary['size']):
+        prefix, digest = await loop.run_in_executor(pool, file_digests, file, summary['size'], end)
+        if prefix == summary['digest']:
+            tail = await loop.run_in_executor(pool, scan_file, file, summary['size'], end)
+            return dict(summary, size=end, mtime=status.st_mtime_ns, digest=digest, scan=merge_scans([summary['scan'], tail])), summary['size']
+    digests = loop.run_in_executor(pool, file_digests, file, None, end)
+    scan = await loop.run_in_executor(pool, scan_file, file, 0, end)
+    return {'size': status.st_size, 'mtime': status.st_mtime_ns, 'digest': (await digests)[1], 'scan': scan, 'titles': set(), 'counts': {}}, 0
+
+async def count_summary(file, summary, start, selected, word_boundaries, pool):
+    """
+    Brings the title counts of a summary up to date: every title is counted
+    in the bytes after start, and the selected titles the summary did not
+    count yet are counted before.
+
+    Args:
+        file (str): Path to the CSV file.
+        summary (dict): The summary of the file, from scan_summary.
+        start (int): Byte offset from which the titles have to be counted again.
+        selected (tuple of str): The titles to count.
+        word_boundaries (bool): Only count the titles found as whole words.
+        pool (ProcessPoolExecutor): The process pool.
+
+    Returns:
+        dict: The updated summary.
+    """
+    titles = summary['titles'] | set(selected)
+    missing = tuple(title for title in selected if title not in summary['titles'])
+    end = summary['size'] if file.endswith('.csv') else None
+    parts = [summary['counts']]
+    if start < summary['size'] and titles:
+        parts.append(count_titles_in_pool(file, tuple(sorted(titles)), word_boundaries, pool, start, end))
+    if start > 0 and missing:
+        parts.append(count_titles_in_pool(file, missing, word_boundaries, pool, 0, start if end is not None else None))
+    counts = merge_counts([parts[0]] + await asyncio.gather(*parts[1:]))
+    return dict(summary, titles=titles, counts=counts)
+
+async def process_files(name, files, meshTree, word_boundaries=False, pool=None, cache=None):
+    """
+    Processes one output, made of one file or of the shards of a sharded
+    output, on a process pool: the files are scanned in parallel, then the
+    titles of the unique IDs of all of them are counted in parallel, and the
+    partial results are merged.
+
+    With a cache, the summary of each file is read from it and only the
+    files, or the parts of the files, changed since are read again.
+
+    Args:
+        name (str): The name of the output in the statistics.
+        files (list of str): The CSV files of the output.
+        meshTree (list of str): List of mesh data from a file.
+        word_boundaries (bool): Only count the titles found as whole words.
+        pool (ProcessPoolExecutor): The process pool, a new one by default.
+        cache (StatsCache): The cache of the summaries of the files.
+
+    Returns:
+        tuple: A tuple containing statistics, filtered data lines, the
+               counts of each node of the MeSH tree and the unique id column
+               of each document.
+    """
+    if pool is None:
+        with ProcessPoolExecutor() as pool:
+            return await process_files(name, files, meshTree, word_boundaries, pool, cache)
+    cached = [cache.get(file, word_boundaries) if cache is not None else None for file in files]
+    scanned = await asyncio.gather(*[scan_summary(file, summary, pool) for file, summary in zip(files, cached)])
+    scan = merge_scans([summary['scan'] for summary, _ in scanned])
+    uilists = scan[3]
+    titles = unique_id_titles(meshTree, file_language(name)) if file_language(name) in ('en', 'fr') else {}
+    selected = tuple(dict.fromkeys(titles[ui] for ui in uilists if ui in titles))
+    summaries = await asyncio.gather(*[count_summary(file, summary, start, selected, word_boundaries, pool) for file, (summary, start) in zip(files, scanned)])
+    if cache is not None:
+        for file, summary in zip(files, summaries):
+            cache.put(file, word_boundaries, summary)
+    counts = merge_counts([summary['counts'] for summary in summaries])
+    uiCounts = {ui: counts[titles[ui]] for ui in uilists if ui in titles and titles[ui] in counts}
+    return (scan_stats(name, scan), filter_lines(data_lines(uilists, titles, counts)), mesh_rollup.branch_counts(meshTree, scan[4], uiCounts), scan[5])
+
+async def process_file(file, meshTree, word_boundaries=False, pool=None, cache=None):
+    """
+    Asynchronously processes a CSV file, extracting and analyzing data.
+
+    Args:
+        file (str): Path to the CSV file, optionally gzip (.csv.gz) or zstd (.csv.zst) compressed.
         meshTree (list of str): List of mesh data from a file.
+        word_boundaries (bool): Only count the titles found as whole words.
+        pool (ProcessPoolExecutor): The process pool, a new one by default.
+        cache (StatsCache): The cache of the summaries of the files.
 
     Returns:
-        tuple: A tuple containing statistics and filtered data lines.
+        tuple: A tuple containing statistics, filtered data lines, the
+               counts of each node of the MeSH tree and the unique id column
+               of each document.
 
     This function reads the CSV file, processes each row to extract
     Mesh IDs, titles, and abstracts, then calculates statistics based
     on occurrences of Mesh titles in titles and abstracts.
     """
-    async with aiofiles.open(file, encoding="utf-8", newline='') as f:
-        reader = csv.reader(await f.readlines(), delimiter='|')
-        urls = []
-        meshlists = set()
-        uilists = set()
-        titles = ""
-        abstracts = ""
-        abstractsList = []
-
-        for row in reader:
-            urls.append(row[0])
-
-            for mesh in row[1].split(";"):
-                meshlists.add(mesh)
-            
-            for ui in row[2].split(";"):
-                uilists.add(ui)
-
-            titles += row[3] + " "
-            abstracts += row[4] + " "
-            abstractsList.append(row[4])
-
-    lines = []
-    if file.split(".")[0].split("_")[-1] == 'en':
-        for ui in uilists:
-            title = UniqueIDToTitle(ui, meshTree)[0].lower()
-            lines.append([title, titles.count(title), abstracts.count(title), sum([1 for text in abstractsList if title in text])])
-    elif file.split(".")[0].split("_")[-1] == 'fr':
-        for ui in uilists:
-            title = UniqueIDToFrenchTitle(ui, meshTree)[0].lower()
-            lines.append([title, titles.count(title), abstracts.count(title), sum([1 for text in abstractsList if title in text])])
-    
-    lines.sort(key=lambda l: (l[2], l[1]), reverse=True)
+    return await process_files(file, [file], meshTree, word_boundaries, pool, cache)
 
-    filtered_lines = [line for line in lines if line[1] != 0 and line[2] != 0]
+async def process_manifest(manifest, meshTree, word_boundaries=False, pool=None, cache=None):
+    """
+    Asynchronously processes the shards of a sharded output and merges their
+    results. The titles of the unique IDs of all the shards are counted in
+    every shard, as they would be in a single file.
+
+    Args:
+        manifest (str): Path to the manifest of the sharded output.
+        meshTree (list of str): List of mesh data from a file.
+        word_boundaries (bool): Only count the titles found as whole words.
+        pool (ProcessPoolExecutor): The process pool, a new one by default.
+        cache (StatsCache): The cache of the summaries of the files.
 
-    stats = [file, len(urls), len(titles.split(" ")), len(abstracts.split(" ")), len((titles + abstracts).split(" "))]
-    return (stats, filtered_lines)
+    Returns:
+        tuple: A tuple containing statistics, filtered data lines, the
+               counts of each node of the MeSH tree and the unique id column
+               of each document, of the whole output.
+    """
+    return await process_files(manifest, manifest_files(manifest), meshTree, word_boundaries, pool, cache)
 
-async def stats(files, folder_name):
+async def stats(files, folder_name, word_boundaries=False):
     """
     Asynchronously computes statistics across multiple CSV files.
 
     Args:
-        files (list of str): List of CSV files to process.
+        files (list of str): List of CSV files, or manifests of sharded outputs, to process.
         folder_name (str): Name of the folder for output files.
+        word_boundaries (bool): Only count the MeSH titles found as whole words.
 
     This function creates statistics and filtered data for each file,
     then writes the aggregated statistics and filtered data to respective
@@ -108,8 +483,13 @@ async def stats(files, folder_name):
     all_stats_file = f'stats/{folder_name}/all_files_stats.csv'
     combined_file = f'stats/{folder_name}/{folder_name}_stats.csv'
 
-    tasks = [process_file(file, meshTree) for file in files]
-    results = await asyncio.gather(*tasks)
+    # One process pool for all the files, whose scans and counts are interleaved on it,
+    # and the summaries of the previous runs so that only what changed since is read
+    cache = StatsCache()
+    with ProcessPoolExecutor() as pool:
+        tasks = [process_manifest(file, meshTree, word_boundaries, pool, cache) if file.endswith('.manifest.json') else process_file(file, meshTree, word_boundaries, pool, cache) for file in files]
+        results = await asyncio.gather(*tasks)
+    cache.close()
 
     all_stats = [result[0] for result in results]
     all_filtered_lines = [line for result in results for line in result[1]]
@@ -118,6 +498,22 @@ async def stats(files, folder_name):
 
     await write_file(combined_file, all_filtered_lines)
 
+    # Counts of every branch of the MeSH tree, with one table per depth
+    language = file_language(files[0]) if files and file_language(files[0]) == 'fr' else 'en'
+    column = 0 if language == 'fr' else 1
+    codeTitles = {line.split("|")[2]: line.split("|")[column] for line in meshTree}
+    # The files hold different documents, so the counts of a node in each of them add up
+    rolled = merge_counts([result[2] for result in results])
+    await asyncio.to_thread(mesh_rollup.write_level_tables, f'stats/{folder_name}', folder_name, rolled, codeTitles)
+
+    # MeSH co-occurrences over all the documents of the selected files, from their cached summaries
+    if cooccurrence.sparse is None:
+        print("numpy and scipy are required for the co-occurrence matrix, skipped.")
+    else:
+        documents = [document for result in results for document in result[3]]
+        await asyncio.to_thread(cooccurrence.export_cooccurrence, documents, unique_id_titles(meshTree, language),
+                                f'stats/{folder_name}/{folder_name}_cooccurrence.npz', f'stats/{folder_name}/{folder_name}_cooccurrence_pairs.csv')
+
     print("Data have been correctly retrieved.")
 
     return True
\ No newline at end of file
@@ -1,52 +1,235 @@
 import aiohttp
-from bs4 import BeautifulSoup
+import asyncio
+import json
+import os
+from urllib.parse import unquote
+from common.http_cache import cached_get
+from common.output_sink import open_sink
 
-async def fetch(url, params):
+# Maximum number of simultaneous connections to each Wikipedia host
+MAX_CONNECTIONS_PER_HOST = 10
+
+# Link of the page saved for each requested title that redirects elsewhere, per language
+TITLE_REDIRECTS_PATH = 'wikipedia/wiki_cache/title_redirects.json'
+title_redirects = None
+
+def create_session(limit_per_host=MAX_CONNECTIONS_PER_HOST):
     """
-    Fetches JSON data of a given URL with parameters asynchronously.
+    Creates the session shared by all the Wikipedia requests of a run, so that
+    connections are kept alive and reused instead of opened for every request.
 
     Args:
-        url (str): The URL to fetch.
-        params (dict): The parameters for the GET request.
+        limit_per_host (int): The maximum number of simultaneous connections to each host.
 
     Returns:
-        dict: JSON data retrieved from the URL.
+        aiohttp.ClientSession: The session, to be closed by the caller.
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params or {}) as response:
-            return await response.json()
+    connector = aiohttp.TCPConnector(limit_per_host=limit_per_host, ttl_dns_cache=300, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector, headers={"Accept-Encoding": "gzip, deflate"}, auto_decompress=True)
 
-async def fetch(url):
+async def fetch(session, url, params=None):
     """
-    Fetches the content of a given URL asynchronously.
+    Fetches the content of a given URL asynchronously through the response cache.
 
     Args:
+        session (aiohttp.ClientSession): The shared Wikipedia session.
         url (str): The URL to fetch.
+        params (dict): The parameters for the GET request.
 
     Returns:
         str: The text content of the response.
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            return await response.text()
-        
-async def get_content_from_title_via_api(title, langage):
+    response = await cached_get(session, url, params, 'wikipedia')
+    return response.text
+
+def title_to_link(title):
     """
-    Retrieves content from the Wikipedia API based on the given title and language.
+    Builds the link saved in the CSV files for a Wikipedia page title.
 
     Args:
-        title (str): The title of the Wikipedia page to retrieve.
+        title (str): The title of the Wikipedia page.
+
+    Returns:
+        str: The link to the page.
+    """
+    title = title.replace(" ", "_")
+    return "https://en.wikipedia.org/wiki/" + title[:1].upper() + title[1:]
+
+def link_to_title(link):
+    """
+    Extracts the page title from a Wikipedia link.
+
+    Args:
+        link (str): The link to the Wikipedia page.
+
+    Returns:
+        str: The title of the page.
+    """
+    return unquote(link.split("/wiki/")[-1].split("#")[0]).replace("_", " ")
+
+def load_title_redirects():
+    """
+    Gives the redirects recorded by the previous runs, read from the disk once per process.
+
+    Returns:
+        dict: For each language ('0' or '1'), the link of each requested title mapped to the link of the saved page.
+    """
+    global title_redirects
+    if title_redirects is None:
+        title_redirects = {'0': {}, '1': {}}
+        if os.path.exists(TITLE_REDIRECTS_PATH):
+            with open(TITLE_REDIRECTS_PATH, 'r', encoding='utf-8') as f:
+                title_redirects.update(json.load(f))
+    return title_redirects
+
+def record_redirect(title, link, langage):
+    """
+    Records the link of the page saved for a requested title, if the title redirects to another page.
+
+    Args:
+        title (str): The requested title.
+        link (str): The link of the saved page.
+        langage (int): Language identifier (1 for French, 0 for English).
+    """
+    if title_to_link(title) != link:
+        load_title_redirects()[str(langage)][title_to_link(title)] = link
+
+def save_title_redirects():
+    """
+    Writes the recorded redirects to the disk, for the next runs.
+    """
+    if title_redirects is not None:
+        os.makedirs(os.path.dirname(TITLE_REDIRECTS_PATH), exist_ok=True)
+        with open(TITLE_REDIRECTS_PATH, 'w', encoding='utf-8') as f:
+            json.dump(title_redirects, f)
+
+def saved_link(title, langage):
+    """
+    Builds the link a page requested under a title is saved with: the title
+    as the API normalises its first letter and spaces, or the page it
+    redirected to when it was saved before.
+
+    Args:
+        title (str): The title, as requested from the API.
         langage (int): Language identifier (1 for French, 0 for English).
 
     Returns:
-        tuple: A tuple containing the title, link, and content of the Wikipedia page if successful,
-               or (None, None, None) if no content is found.
+        str: The link of the saved page.
+    """
+    link = title_to_link(title)
+    return load_title_redirects()[str(langage)].get(link, link)
+
+def skip_known_page(title, known_urls, progress, french_or_english):
+    """
+    Checks whether the page of a title is already saved and counts the task as skipped if so.
+
+    Args:
+        title (str): The title of the Wikipedia page, as requested from the API.
+        known_urls (KnownUrls): The URLs already saved in the output file.
+        progress (ProgressTracker): The progress of the run.
+        french_or_english: Flag indicating whether the page is French (1) or English (0).
+
+    Returns:
+        bool: True if the page must not be fetched.
+    """
+    if not known_urls.skip(saved_link(title, french_or_english)):
+        return False
+    progress.advance(skipped=1)
+    return True
+
+# Maximum number of titles the MediaWiki API accepts in one query
+API_TITLES_LIMIT = 50
+
+def api_url(langage):
+    """
+    Gives the MediaWiki API endpoint of a language.
+
+    Args:
+        langage (int): Language identifier (1 for French, 0 for English).
+
+    Returns:
+        str: The URL of the API.
     """
     if langage == 1:
-        url = "https://fr.wikipedia.org/w/api.php"
-    else :            
-        url = "https://en.wikipedia.org/w/api.php"
+        return "https://fr.wikipedia.org/w/api.php"
+    return "https://en.wikipedia.org/w/api.php"
 
+def resolve_title(title, normalized, redirects):
+    """
+    Follows the normalizations and redirects reported by the API for a requested title.
+
+    Args:
+        title (str): The requested title.
+        normalized (dict): The 'normalized' array of the API, as a from -> to mapping.
+        redirects (dict): The 'redirects' array of the API, as a from -> to mapping.
+
+    Returns:
+        str: The title of the page the API answered with.
+    """
+    title = normalized.get(title, title)
+    seen = set()
+    while title in redirects and title not in seen:
+        seen.add(title)
+        title = redirects[title]
+    return title
+
+async def query_pages(session, titles, langage):
+    """
+    Resolves up to API_TITLES_LIMIT titles to their pages in one query, following
+    the normalizations and redirects but without fetching any content.
+
+    Args:
+        session (aiohttp.ClientSession): The session to use for the requests.
+        titles (list): The titles to resolve.
+        langage (int): Language identifier (1 for French, 0 for English).
+
+    Returns:
+        dict: The requested titles mapped to the title of their page, or to None if the page does not exist.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "titles": "|".join(titles),
+        "redirects": 1
+    }
+    normalized = {}
+    redirects = {}
+    pages = set()
+    while True:
+        response = await cached_get(session, api_url(langage), params, 'wikipedia')
+        if response.status != 200:
+            print("Erreur de récupération")
+            break
+        data = response.json()
+        query = data.get('query', {})
+        normalized.update({item['from']: item['to'] for item in query.get('normalized', [])})
+        redirects.update({item['from']: item['to'] for item in query.get('redirects', [])})
+        for page in query.get('pages', {}).values():
+            if 'missing' not in page and 'invalid' not in page:
+                pages.add(page['title'])
+        if 'continue' not in data:
+            break
+        params = {**params, **data['continue']}
+
+    resolved = {}
+    for title in titles:
+        title_in_wiki = resolve_title(title, normalized, redirects)
+        resolved[title] = title_in_wiki if title_in_wiki in pages else None
+    return resolved
+
+async def query_extract(session, title, langage):
+    """
+    Queries the plain text extract of one page. The API gives the full text of
+    a single page per request, so the pages are queried one by one.
+
+    Args:
+        session (aiohttp.ClientSession): The session to use for the request.
+        title (str): The title of the page, as resolved by query_pages.
+        langage (int): Language identifier (1 for French, 0 for English).
+
+    Returns:
+        str: The content of the page, or None if no content is found.
+    """
     params = {
         "action": "query",
         "format": "json",
@@ -55,45 +238,145 @@ async def get_content_from_title_via_api(title, langage):
         "titles": title,
         "redirects": 1
     }
+    response = await cached_get(session, api_url(langage), params, 'wikipedia')
+    if response.status != 200:
+        print("Erreur de récupération")
+        return None
+    for page in response.json().get('query', {}).get('pages', {}).values():
+        if page.get('extract', '').strip() != '':
+            return page['extract']
+    return None
+
+async def query_extracts(session, titles, langage):
+    """
+    Queries the plain text extracts of up to API_TITLES_LIMIT titles: the titles
+    are resolved to their pages in one batched query, then the extract of each
+    distinct page is requested concurrently on the shared session.
+
+    Args:
+        session (aiohttp.ClientSession): The session to use for the requests.
+        titles (list): The titles to query.
+        langage (int): Language identifier (1 for French, 0 for English).
+
+    Returns:
+        dict: The requested titles mapped to (title, link, content), or to
+              (None, None, None) if no content is found.
+    """
+    resolved = await query_pages(session, titles, langage)
+    pages = list(dict.fromkeys(page for page in resolved.values() if page is not None))
+    extracts = dict(zip(pages, await asyncio.gather(*[query_extract(session, page, langage) for page in pages])))
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as response:
-            if response.status == 200:
-                data = await response.json()
-                page = next(iter(data['query']['pages'].values()))
-                if 'extract' in page:
-                    title_in_wiki = page['title']
-                    link = "https://en.wikipedia.org/wiki/" + title_in_wiki.replace(" ", "_")
-                    content = page['extract']
-                    if content.strip() == '':
-                        return None, None, None
-                    return title_in_wiki, link, content
-            else:
-                print("Erreur de récupération")
-    return None, None, None
+    contents = {}
+    for title in titles:
+        title_in_wiki = resolved[title]
+        content = extracts.get(title_in_wiki)
+        if content is None:
+            contents[title] = (None, None, None)
+        else:
+            contents[title] = (title_in_wiki, title_to_link(title_in_wiki), content)
+            record_redirect(title, title_to_link(title_in_wiki), langage)
+    return contents
 
-async def get_french_link(english_link):
+async def get_contents_from_titles_via_api(titles, langage, session):
     """
-    Retrieves the link to the French language version of a Wikipedia page given its English link.
+    Retrieves the content of several Wikipedia pages, resolving their titles
+    with batched API queries and fetching their extracts concurrently.
 
     Args:
-        english_link (str): The link to the English Wikipedia page.
+        titles (list): The titles of the Wikipedia pages to retrieve.
+        langage (int): Language identifier (1 for French, 0 for English).
+        session (aiohttp.ClientSession): The shared Wikipedia session.
 
     Returns:
-        str: The link to the corresponding French Wikipedia page if found, otherwise None.
+        dict: Each requested title mapped to a tuple containing the title, link and
+              content of the page, or (None, None, None) if no content is found.
+    """
+    titles = list(dict.fromkeys(titles))
+    batches = [titles[i:i + API_TITLES_LIMIT] for i in range(0, len(titles), API_TITLES_LIMIT)]
+    contents = {}
+    for batch_contents in await asyncio.gather(*[query_extracts(session, batch, langage) for batch in batches]):
+        contents.update(batch_contents)
+    return contents
+
+async def get_content_from_title_via_api(title, langage, session):
     """
-    response = await fetch(english_link)
-    soup = BeautifulSoup(response, 'html.parser')
-    links_langage = soup.find_all('a', class_='interlanguage-link-target')
-    french_link = None
-    for link_l in links_langage:
-        if 'Français' in link_l.text:
-            french_link = link_l.get('href')
-    return french_link
+    Retrieves content from the Wikipedia API based on the given title and language.
+
+    Args:
+        title (str): The title of the Wikipedia page to retrieve.
+        langage (int): Language identifier (1 for French, 0 for English).
+        session (aiohttp.ClientSession): The shared Wikipedia session.
+
+    Returns:
+        tuple: A tuple containing the title, link, and content of the Wikipedia page if successful,
+               or (None, None, None) if no content is found.
+    """
+    contents = await get_contents_from_titles_via_api([title], langage, session)
+    return contents[title]
+
+async def query_french_titles(session, titles):
+    """
+    Queries the French interlanguage links of up to API_TITLES_LIMIT English titles,
+    following the continuation tokens.
+
+    Args:
+        session (aiohttp.ClientSession): The session to use for the requests.
+        titles (list): The English titles to query.
+
+    Returns:
+        dict: The requested titles mapped to the title of the French page, or to None.
+    """
+    params = {
+        "action": "query",
+        "format": "json",
+        "prop": "langlinks",
+        "lllang": "fr",
+        "lllimit": "max",
+        "titles": "|".join(titles),
+        "redirects": 1
+    }
+    normalized = {}
+    redirects = {}
+    french_titles = {}
+    while True:
+        response = await cached_get(session, api_url(0), params, 'wikipedia')
+        if response.status != 200:
+            print("Erreur de récupération")
+            break
+        data = response.json()
+        query = data.get('query', {})
+        normalized.update({item['from']: item['to'] for item in query.get('normalized', [])})
+        redirects.update({item['from']: item['to'] for item in query.get('redirects', [])})
+        for page in query.get('pages', {}).values():
+            for langlink in page.get('langlinks', []):
+                french_titles[page['title']] = langlink.get('*', langlink.get('title'))
+        if 'continue' not in data:
+            break
+        params = {**params, **data['continue']}
+    return {title: french_titles.get(resolve_title(title, normalized, redirects)) for title in titles}
+
+async def get_french_titles(titles, session):
+    """
+    Retrieves the French page titles of several English Wikipedia pages with
+    batched langlinks API queries.
+
+    Args:
+        titles (list): The titles of the English Wikipedia pages.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
+
+    Returns:
+        dict: Each English title mapped to the title of the corresponding French page if found, otherwise None.
+    """
+    titles = list(dict.fromkeys(titles))
+    batches = [titles[i:i + API_TITLES_LIMIT] for i in range(0, len(titles), API_TITLES_LIMIT)]
+    french_titles = {}
+    for batch_titles in await asyncio.gather(*[query_french_titles(session, batch) for batch in batches]):
+        french_titles.update(batch_titles)
+    return french_titles
         
 async def save_to_csv(link, mesh, UI, title, content, filename, writer):
     """
-    Saves data to a CSV file asynchronously.
+    Buffers a row of data in the output sink, which writes it in batches.
 
     Args:
         link (str): The link to the Wikipedia page.
@@ -102,13 +385,132 @@ async def save_to_csv(link, mesh, UI, title, content, filename, writer):
         title (str): The title of the Wikipedia page.
         content (str): The content of the Wikipedia page.
         filename (str): The name of the CSV file to save the data to.
-        writer (csv.writer): The CSV writer object.
+        writer: The output sink.
 
     Returns:
         None
     """
     await writer.writerow([link, mesh, UI, title, content])
+
+def language_path(filename, french_or_english):
+    """
+    Gives the path of the output of a language, without extension.
+
+    Args:
+        filename (str): The name of the output file.
+        french_or_english (int): Language identifier (1 for French, 0 for English).
+
+    Returns:
+        str: The path of the output, e.g. 'wikipedia/wiki_data/heart_fr'.
+    """
+    suffix = "_fr" if french_or_english == 1 else "_en"
+    return "wikipedia/wiki_data/" + filename + suffix
+
+def language_file(filename, french_or_english, openType, sink='csv'):
+    """
+    Opens the output of a language.
+
+    Args:
+        filename (str): The name of the output file.
+        french_or_english (int): Language identifier (1 for French, 0 for English).
+        openType (str): The mode in which the file is opened.
+        sink (str): The output format, e.g. 'csv' or 'parquet'.
+
+    Returns:
+        The sink of the output, to be used as an asynchronous context manager.
+    """
+    if not os.path.exists('wikipedia/wiki_data'):
+        # Create the directory if not existing
+        os.makedirs('wikipedia/wiki_data', exist_ok=True)
+    return open_sink(sink, language_path(filename, french_or_english), openType)
+
+async def save_results_as_completed(tasks, filename, writer):
+    """
+    Saves the results of retrieval tasks as soon as each of them completes, and
+    reports the number of saved pages once all of them are done.
+
+    Args:
+        tasks (list): The retrieval coroutines. Each one returns a
+            (link, mesh, UI, title, content) tuple, a list of them, or False.
+        filename (str): The name of the CSV file to save the data to.
+        writer: The output sink.
+
+    Returns:
+        None
+    """
+    saved = 0
+    for task in asyncio.as_completed(tasks):
+        result = await task
+        for wiki_data in (result if isinstance(result, list) else [result]):
+            if wiki_data:
+                link, mesh, UI, title, content = wiki_data
+                await save_to_csv(link, mesh, UI, title, content, filename, writer)
+                saved += 1
+    save_title_redirects()
     bold = '\033[1m'
     end = '\033[0m'
     underline = '\033[4m'
-    print(f"{bold}{underline}WIKIPEDIA :{end} Data from {bold}{title, mesh, UI}{end} successfully saved in {bold}{filename}.csv{end} .")
\ No newline at end of file
+    print(f"{bold}{underline}WIKIPEDIA :{end} {saved} page(s) successfully saved in {bold}{filename}{end} .")
+
+async def save_language(retrieval, filename, openType, french_or_english, sink='csv'):
+    """
+    Runs the retrieval of a topic in one language and saves its pages as soon as they arrive.
+
+    Args:
+        retrieval (coroutine): The retrieval of the topic, returning a
+            (link, mesh, UI, title, content) tuple, a list of them, or False.
+        filename (str): The name of the output CSV file.
+        openType (str): The mode in which the file is opened.
+        french_or_english: Flag indicating whether the pages are French (1) or English (0).
+        sink (str): The output format, e.g. 'csv' or 'parquet'.
+    """
+    async with language_file(filename, french_or_english, openType, sink) as writer:
+        await save_results_as_completed([retrieval], filename, writer)
+
+if __name__ == "__main__":
+    # Request latency with a new session per request against the shared session,
+    # measured on a local stub server: python -m wikipedia.wiki_search.wiki
+    import time
+    from aiohttp import web
+
+    async def stub(request):
+        return web.json_response({"query": {"pages": {"1": {"title": "Stub", "extract": "x" * 2000}}}})
+
+    async def benchmark(nb_requests=200, concurrency=10):
+        app = web.Application()
+        app.router.add_get('/w/api.php', stub)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/w/api.php"
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(session):
+            # Bypasses the response cache, which would answer every request after the first
+            async with session.get(url) as response:
+                return await response.text()
+
+        async def fresh_session_request():
+            async with semaphore:
+                async with aiohttp.ClientSession() as session:
+                    return await request(session)
+
+        async def shared_session_request(session):
+            async with semaphore:
+                return await request(session)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[fresh_session_request() for _ in range(nb_requests)])
+        fresh = time.perf_counter() - start
+
+        async with create_session(concurrency) as session:
+            start = time.perf_counter()
+            await asyncio.gather(*[shared_session_request(session) for _ in range(nb_requests)])
+            shared = time.perf_counter() - start
+
+        await runner.cleanup()
+        print(f"Session per request : {fresh / nb_requests * 1000:.2f} ms/request")
+        print(f"Shared session      : {shared / nb_requests * 1000:.2f} ms/request")
+
+    asyncio.run(benchmark())
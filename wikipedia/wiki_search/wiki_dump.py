@@ -0,0 +1,399 @@
+import argparse
+import asyncio
+import bz2
+import os
+import re
+import sqlite3
+import sys
+import threading
+import xml.etree.ElementTree as ET
+from MeSH.meshData_func import depthMeshCode, MeshToUniqueID, UniqueIDToMesh, MeshToEnglishTitle, MeshToFrenchTitle
+from common.output_sink import load_known_urls
+import wikipedia.wiki_search.wiki as wiki
+
+# Constants for styling console output
+bold = '\033[1m'
+end = '\033[0m'
+underline = '\033[4m'
+red = '\033[91m'
+
+# Number of index rows inserted per transaction
+INDEX_BATCH_SIZE = 10000
+
+def open_dump(dump_path):
+    """
+    Opens a Wikipedia XML dump, compressed with bzip2 or not.
+
+    Args:
+        dump_path (str): Path to the dump, e.g. 'frwiki-latest-pages-articles.xml.bz2'.
+
+    Returns:
+        file: The dump opened in binary mode.
+    """
+    if dump_path.endswith('.bz2'):
+        return bz2.open(dump_path, 'rb')
+    return open(dump_path, 'rb')
+
+def local_name(tag):
+    """
+    Removes the XML namespace of a tag.
+
+    Args:
+        tag (str): The tag, e.g. '{http://www.mediawiki.org/xml/export-0.10/}page'.
+
+    Returns:
+        str: The tag without namespace, e.g. 'page'.
+    """
+    return tag.rsplit('}', 1)[-1]
+
+def iter_pages(dump_path):
+    """
+    Streams the articles of a Wikipedia XML dump.
+
+    Every page element is cleared once read so that memory stays bounded
+    whatever the size of the dump.
+
+    Args:
+        dump_path (str): Path to the dump.
+
+    Yields:
+        tuple: The title of the article, the title it redirects to (or None) and its wikitext.
+    """
+    with open_dump(dump_path) as dump:
+        root = None
+        for event, elem in ET.iterparse(dump, events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event != 'end' or local_name(elem.tag) != 'page':
+                continue
+            fields = {local_name(child.tag): child for child in elem}
+            namespace = fields.get('ns')
+            if namespace is None or namespace.text == '0':
+                redirect = fields.get('redirect')
+                text = elem.find('./{*}revision/{*}text')
+                yield (fields['title'].text,
+                       redirect.get('title') if redirect is not None else None,
+                       (text.text or '') if text is not None else '')
+            root.clear()
+
+def title_key(title):
+    """
+    Gives the key under which a title is indexed, so that lookups ignore case
+    and underscores like the API searches of the online path.
+
+    Args:
+        title (str): The title.
+
+    Returns:
+        str: The key of the title.
+    """
+    return title.replace('_', ' ').strip().casefold()
+
+def build_index(dump_path, index_path=None):
+    """
+    Builds the on-disk title/redirect index of a dump, or reuses it if it was
+    built from the same dump.
+
+    Args:
+        dump_path (str): Path to the dump.
+        index_path (str): Path to the SQLite index, next to the dump by default.
+
+    Returns:
+        sqlite3.Connection: The connection to the index.
+    """
+    index_path = index_path or dump_path + '.index.sqlite'
+    stamp = f"{os.path.getsize(dump_path)}:{os.path.getmtime(dump_path)}"
+    index = sqlite3.connect(index_path)
+    index.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    built = index.execute("SELECT value FROM meta WHERE key = 'dump'").fetchone()
+    if built is not None and built[0] == stamp:
+        return index
+
+    print(f"{bold}{underline}WIKIPEDIA :{end} Indexing {bold}{dump_path}{end}...")
+    index.execute("DROP TABLE IF EXISTS pages")
+    index.execute("CREATE TABLE pages (key TEXT PRIMARY KEY, title TEXT, redirect TEXT)")
+    rows = []
+    for title, redirect, _ in iter_pages(dump_path):
+        rows.append((title_key(title), title, redirect))
+        if len(rows) >= INDEX_BATCH_SIZE:
+            with index:
+                index.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", rows)
+            rows = []
+    with index:
+        index.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", rows)
+        index.execute("INSERT OR REPLACE INTO meta VALUES ('dump', ?)", (stamp,))
+    return index
+
+def resolve_title(index, title, max_redirects=5):
+    """
+    Finds the article a title leads to, following redirects.
+
+    Args:
+        index (sqlite3.Connection): The title/redirect index of the dump.
+        title (str): The title to look for.
+        max_redirects (int): The maximum number of redirects to follow.
+
+    Returns:
+        str: The title of the article, or None if the dump has no such article.
+    """
+    for _ in range(max_redirects + 1):
+        row = index.execute("SELECT title, redirect FROM pages WHERE key = ?", (title_key(title),)).fetchone()
+        if row is None:
+            return None
+        if row[1] is None:
+            return row[0]
+        title = row[1].split('#')[0]
+    return None
+
+def strip_nested(text, opening, closing):
+    """
+    Removes the nested blocks delimited by two markers, e.g. templates.
+
+    Args:
+        text (str): The wikitext.
+        opening (str): The opening marker, e.g. '{{'.
+        closing (str): The closing marker, e.g. '}}'.
+
+    Returns:
+        str: The wikitext without the blocks.
+    """
+    result = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        if text.startswith(opening, i):
+            depth += 1
+            i += len(opening)
+        elif depth > 0 and text.startswith(closing, i):
+            depth -= 1
+            i += len(closing)
+        else:
+            if depth == 0:
+                result.append(text[i])
+            i += 1
+    return ''.join(result)
+
+def wikitext_to_text(wikitext):
+    """
+    Converts wikitext to plain text, close to the 'explaintext' extracts of the API.
+
+    Args:
+        wikitext (str): The wikitext of an article.
+
+    Returns:
+        str: The plain text of the article.
+    """
+    text = re.sub(r'<!--.*?-->', '', wikitext, flags=re.S)
+    text = re.sub(r'<ref[^>/]*/>', '', text)
+    text = re.sub(r'<ref[^>]*>.*?</ref>', '', text, flags=re.S)
+    text = strip_nested(text, '{{', '}}')
+    text = strip_nested(text, '{|', '|}')
+    text = re.sub(r'\[\[(?:File|Image|Fichier|Category|Catégorie):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]', '', text, flags=re.I)
+    text = re.sub(r'\[\[[^\]|]*\|([^\]]*)\]\]', r'\1', text)
+    text = re.sub(r'\[\[([^\]]*)\]\]', r'\1', text)
+    text = re.sub(r'\[https?://[^\s\]]+ ([^\]]*)\]', r'\1', text)
+    text = re.sub(r'\[https?://[^\]]*\]', '', text)
+    text = re.sub(r"'{2,}", '', text)
+    text = re.sub(r'^(=+)\s*(.*?)\s*\1\s*$', r'\2', text, flags=re.M)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+def extract_articles(dump_path, wanted, save):
+    """
+    Streams a dump once and hands the article of each of some titles to save
+    as soon as it is read, stopping once all of them are found, so no more
+    than one article is held in memory.
+
+    Args:
+        dump_path (str): Path to the dump.
+        wanted (dict): The MeSH codes and unique ID of each title, as resolved by resolve_title.
+        save (callable): Called with the link, MeSH codes, unique ID, title and
+            plain text of each article found, returns False to stop the scan.
+
+    Returns:
+        int: The number of articles saved.
+    """
+    wanted = dict(wanted)
+    saved = 0
+    for title, redirect, wikitext in iter_pages(dump_path):
+        if redirect is None and title in wanted:
+            mesh, ui = wanted.pop(title)
+            if save([wiki.title_to_link(title), mesh, ui, title, wikitext_to_text(wikitext)]) is False:
+                break
+            saved += 1
+            if not wanted:
+                break
+    return saved
+
+def wanted_titles(index, topic, depth, meshTree, french_or_english):
+    """
+    Resolves the titles of the MeSH terms related to a topic in the title/redirect index of a dump.
+
+    Args:
+        index (sqlite3.Connection): The title/redirect index of the dump.
+        topic (str): The MeSH code to search for.
+        depth (int): The depth of the MeSH tree to search.
+        meshTree (list): The list representing the MeSH tree structure.
+        french_or_english (int): Language of the dump (1 for French, 0 for English).
+
+    Returns:
+        dict: The MeSH codes and unique ID of the article of each title found.
+    """
+    wanted = {}
+    for mesh in depthMeshCode(topic, depth, meshTree):
+        ui = MeshToUniqueID(mesh, meshTree)[0]
+        if french_or_english == 1:
+            mesh_title = MeshToFrenchTitle(mesh, meshTree)[0]
+        else:
+            mesh_title = MeshToEnglishTitle(mesh, meshTree)[0]
+        title = resolve_title(index, mesh_title)
+        if title is None:
+            print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
+            continue
+        wanted[title] = (';'.join(UniqueIDToMesh(ui, meshTree)), ui)
+    return wanted
+
+async def launch(dump_path, topic, depth, filename, openType, meshTree, french_or_english, index_path=None, sink='csv'):
+    """
+    Retrieves the Wikipedia data of the MeSH codes related to a topic from a local dump.
+
+    The titles of the MeSH terms are resolved through the title/redirect index
+    of the dump, then the dump is streamed once more, on a worker thread, and
+    each matching article is saved, as soon as it is read, in the same output
+    as the online search.
+    In append mode, the articles already saved are skipped.
+
+    Args:
+        dump_path (str): Path to the dump of the language, e.g. 'enwiki-latest-pages-articles.xml.bz2'.
+        topic (str): The MeSH code to search for.
+        depth (int): The depth of the MeSH tree to search.
+        filename (str): The name of the output file.
+        openType (str): The mode in which the file is opened.
+        meshTree (list): The list representing the MeSH tree structure.
+        french_or_english (int): Language of the dump (1 for French, 0 for English).
+        index_path (str): Path to the SQLite index, next to the dump by default.
+        sink (str): The output format, e.g. 'csv' or 'parquet'.
+
+    Returns:
+        int: The number of articles saved.
+    """
+    def resolve():
+        index = build_index(dump_path, index_path)
+        try:
+            return wanted_titles(index, topic, depth, meshTree, french_or_english)
+        finally:
+            index.close()
+
+    wanted = await asyncio.to_thread(resolve)
+    known_urls = load_known_urls(sink, wiki.language_path(filename, french_or_english), openType)
+    wanted = {title: page for title, page in wanted.items() if not known_urls.skip(wiki.title_to_link(title))}
+    if known_urls.skipped > 0:
+        print(f"{bold}{underline}WIKIPEDIA :{end} {known_urls.skipped} article(s) already saved in {bold}{filename}{end} skipped.")
+    loop = asyncio.get_running_loop()
+    stopped = threading.Event()
+    async with wiki.language_file(filename, french_or_english, openType, sink) as writer:
+        def save(row):
+            # Called on the scanning thread, waits for the row to be buffered by the writer
+            if stopped.is_set():
+                return False
+            asyncio.run_coroutine_threadsafe(writer.writerow(row), loop).result()
+
+        try:
+            saved = await asyncio.to_thread(extract_articles, dump_path, wanted, save) if wanted else 0
+        finally:
+            # Stops the scan if the run is cancelled
+            stopped.set()
+    print(f"{bold}{underline}WIKIPEDIA :{end} {saved} article(s) from {bold}{dump_path}{end} saved in {bold}{wiki.language_path(filename, french_or_english)}{end} .")
+    return saved
+
+# A small dump with an article, chained redirects, a redirect loop and a talk page, for self_check
+SELF_CHECK_DUMP = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+  <page><title>Heart failure</title><ns>0</ns><id>1</id><revision><text>{{Infobox disease|name={{lang|en|Heart failure}}}}
+'''Heart failure''' is a [[syndrome]] of the [[Heart|cardiac]] pump.&lt;ref name="a"&gt;Source&lt;/ref&gt;
+[[File:Heart.png|thumb|A [[heart]]]]
+== Causes ==
+Causes include [[coronary artery disease]]&lt;ref&gt;x&lt;/ref&gt;.
+{| class="wikitable"
+| cell
+|}
+[[Category:Cardiology]]</text></revision></page>
+  <page><title>Cardiac failure</title><ns>0</ns><id>2</id><redirect title="Heart failure" /><revision><text>#REDIRECT [[Heart failure]]</text></revision></page>
+  <page><title>Cardiac insufficiency</title><ns>0</ns><id>3</id><redirect title="Cardiac failure" /><revision><text>#REDIRECT [[Cardiac failure]]</text></revision></page>
+  <page><title>Loop A</title><ns>0</ns><id>4</id><redirect title="Loop B" /><revision><text>#REDIRECT [[Loop B]]</text></revision></page>
+  <page><title>Loop B</title><ns>0</ns><id>5</id><redirect title="Loop A" /><revision><text>#REDIRECT [[Loop A]]</text></revision></page>
+  <page><title>Talk:Heart failure</title><ns>1</ns><id>6</id><revision><text>Discussion</text></revision></page>
+  <page><title>Asthma</title><ns>0</ns><id>7</id><revision><text>'''Asthma''' affects the [[lung]]s.</text></revision></page>
+</mediawiki>
+"""
+
+def self_check():
+    """
+    Checks the parsing, the redirect resolution, the text extraction and the
+    saved rows on a small synthetic dump, in a temporary folder.
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as folder:
+        check_dump(folder)
+    print("Self-check passed.")
+
+def check_dump(folder):
+    """
+    Runs the checks of self_check in a folder.
+    """
+    dump_path = os.path.join(folder, 'test-pages-articles.xml.bz2')
+    with bz2.open(dump_path, 'wt', encoding='utf-8') as f:
+        f.write(SELF_CHECK_DUMP)
+
+    pages = list(iter_pages(dump_path))
+    assert [title for title, _, _ in pages] == ['Heart failure', 'Cardiac failure', 'Cardiac insufficiency', 'Loop A', 'Loop B', 'Asthma'], pages
+    assert pages[0][1] is None and pages[1][1] == 'Heart failure'
+
+    index = build_index(dump_path)
+    assert resolve_title(index, 'Heart failure') == 'Heart failure'
+    assert resolve_title(index, 'heart_FAILURE') == 'Heart failure'
+    assert resolve_title(index, 'Cardiac failure') == 'Heart failure'
+    assert resolve_title(index, 'Cardiac insufficiency') == 'Heart failure'
+    assert resolve_title(index, 'Loop A') is None
+    assert resolve_title(index, 'Talk:Heart failure') is None
+    assert resolve_title(index, 'Missing') is None
+    index.close()
+
+    text = wikitext_to_text(pages[0][2])
+    assert text == "Heart failure is a syndrome of the cardiac pump.\n\nCauses\nCauses include coronary artery disease.", repr(text)
+
+    meshTree = ["insuffisance cardiaque|Cardiac insufficiency|C14.280.434|D006333",
+                "asthme|Asthma|C08.127.108|D001249",
+                "absent|Missing|C14.280.999|D000000"]
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        assert asyncio.run(launch(dump_path, 'C', 3, 'check', 'w', meshTree, 0)) == 2
+        with open('wikipedia/wiki_data/check_en.csv', 'r', encoding='utf-8') as f:
+            rows = sorted(line.split('|')[:4] for line in f.read().splitlines() if line.startswith('https://'))
+        assert rows == [['https://en.wikipedia.org/wiki/Asthma', 'C08.127.108', 'D001249', 'Asthma'],
+                        ['https://en.wikipedia.org/wiki/Heart_failure', 'C14.280.434', 'D006333', 'Heart failure']], rows
+        # The articles already saved are skipped in append mode
+        assert asyncio.run(launch(dump_path, 'C', 3, 'check', 'a', meshTree, 0)) == 0
+    finally:
+        os.chdir(cwd)
+
+if __name__ == "__main__":
+    # python -m wikipedia.wiki_search.wiki_dump frwiki-latest-pages-articles.xml.bz2 C14.280 2 heart --lang fr
+    # Check on a synthetic dump: python -m wikipedia.wiki_search.wiki_dump --self-check
+    if sys.argv[1:] == ['--self-check']:
+        self_check()
+        sys.exit()
+    parser = argparse.ArgumentParser(description="Extract the Wikipedia articles of MeSH terms from a local XML dump.")
+    parser.add_argument('dump', help="Path to the pages-articles XML dump (.xml or .xml.bz2)")
+    parser.add_argument('mesh', help="MeSH code to search for")
+    parser.add_argument('depth', type=int, help="Depth of the MeSH tree to search")
+    parser.add_argument('filename', help="Name of the output file")
+    parser.add_argument('--lang', choices=['en', 'fr'], default='en', help="Language of the dump")
+    parser.add_argument('--append', action='store_true', help="Append to the output file instead of overwriting it")
+    parser.add_argument('--sink', default='csv', help="Output format: csv, csv.gz, csv.zst, parquet, sqlite or sharded")
+    args = parser.parse_args()
+
+    with open('MeSH/meshData.bin', 'r', encoding="utf-8", newline='') as file:
+        meshTree = file.read().splitlines()
+    asyncio.run(launch(args.dump, args.mesh, args.depth, args.filename, 'a' if args.append else 'w', meshTree, 1 if args.lang == 'fr' else 0, sink=args.sink))
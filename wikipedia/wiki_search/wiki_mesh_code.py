@@ -1,12 +1,13 @@
-import csv
+import json
 import os
-import aiofiles
-import aiohttp
+import re
+import time
 import asyncio
 from bs4 import BeautifulSoup
 from MeSH.meshData_func import depthMeshCode, MeshToUniqueID, UniqueIDToMesh
 import wikipedia.wiki_search.wiki as wiki
-from PyQt5.QtWidgets import QApplication
+from common.output_sink import load_known_urls
+from common.progress import ProgressTracker, ProgressReporter
 
 # Constants for styling console output
 bold = '\033[1m'
@@ -14,126 +15,205 @@ end = '\033[0m'
 underline = '\033[4m'
 red = '\033[91m'
 
+# Code -> English article link index of each "List_of_MeSH_codes" page, shared by all the tasks of the process
+MESH_CODES_CACHE_FOLDER = 'wikipedia/wiki_cache/'
+MESH_CODES_CACHE_TTL = 7 * 24 * 3600
+mesh_code_indexes = {}
+pending_mesh_code_indexes = {}
 
-nb_tasks = 0
-nb_tasks_done = 0
-successed_tasks = 0
-failed_tasks = 0
+def parse_mesh_code_index(response):
+    """
+    Parses a "List_of_MeSH_codes" page into an index of its MeSH codes.
+
+    An entry is an <li> without nested list, or an <h3>, whose text holds the
+    code followed by a space. Its third link is the English article of the code.
+
+    Args:
+        response (str): The HTML of the page.
+
+    Returns:
+        dict: Each MeSH code of the page mapped to the link of its English article,
+              or to None if the code has no article.
+    """
+    soup = BeautifulSoup(response, 'html.parser')
+    div = soup.find('div', {'class': 'mw-parser-output'})
+    index = {}
+    if div is None:
+        return index
+    for li in div.find_all('li') + div.find_all('h3'):
+        if li.find('li') is not None:
+            continue
+        codes = re.findall(r'\b[A-Z]\d{2}(?:\.\d{3})*(?= )', li.text)
+        if not codes:
+            continue
+        all_a = li.find_all('a')
+        for code in codes:
+            if len(all_a) < 3:
+                index[code] = None
+            elif index.get(code, '') is not None:
+                index[code] = "https://en.wikipedia.org" + all_a[2]['href']
+    return index
+
+async def build_mesh_code_index(main_code, session):
+    """
+    Builds the index of a "List_of_MeSH_codes" page, from the disk cache if it is recent enough.
+
+    Args:
+        main_code (str): The top level MeSH code of the page, e.g. 'C14'.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
+
+    Returns:
+        dict: Each MeSH code of the page mapped to the link of its English article, or to None.
+    """
+    cache_file = f"{MESH_CODES_CACHE_FOLDER}List_of_MeSH_codes_{main_code}.json"
+    if os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < MESH_CODES_CACHE_TTL:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    response = await wiki.fetch(session, f"https://en.wikipedia.org/wiki/List_of_MeSH_codes_({main_code})")
+    index = parse_mesh_code_index(response)
+    if index:
+        os.makedirs(MESH_CODES_CACHE_FOLDER, exist_ok=True)
+        with open(cache_file, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+    return index
+
+def forget_pending_index(main_code, task):
+    """
+    Removes a finished index task from the pending ones, keeping its index if
+    it succeeded, so that a failed or cancelled build is retried by the next task.
+    """
+    if pending_mesh_code_indexes.get(main_code) is task:
+        del pending_mesh_code_indexes[main_code]
+    if not task.cancelled() and task.exception() is None:
+        mesh_code_indexes[main_code] = task.result()
+
+async def get_mesh_code_index(main_code, session):
+    """
+    Gives the index of a "List_of_MeSH_codes" page, downloading and parsing it
+    at most once for all the concurrent tasks of the process.
+
+    The build is shared by the tasks of the running event loop only: the
+    retrieval worker runs each retrieval on a new loop, and a build left on a
+    previous loop is started again. Cancelling a waiting task does not cancel
+    the build for the others.
+
+    Args:
+        main_code (str): The top level MeSH code of the page, e.g. 'C14'.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
+
+    Returns:
+        dict: Each MeSH code of the page mapped to the link of its English article, or to None.
+    """
+    if main_code in mesh_code_indexes:
+        return mesh_code_indexes[main_code]
+    task = pending_mesh_code_indexes.get(main_code)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(build_mesh_code_index(main_code, session))
+        pending_mesh_code_indexes[main_code] = task
+        task.add_done_callback(lambda task: forget_pending_index(main_code, task))
+    return await asyncio.shield(task)
 
-async def fetch(url):
+def no_page_found(mesh, progress):
     """
-    Fetches the content of a given URL asynchronously.
+    Reports a MeSH code without Wikipedia page and counts its task as failed.
 
     Args:
-        url (str): The URL to fetch.
+        mesh (str): The MeSH code.
+        progress (ProgressTracker): The progress of the run.
 
     Returns:
-        str: The text content of the response.
+        bool: Always False.
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            return await response.text()
+    print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
+    progress.advance(failed=1)
+    return False
 
-async def get_wiki_data_mesh_code(mesh, meshTree, pbar, wikiProgressLabel, french_or_english):
+async def get_wiki_title_mesh_code(mesh, meshTree, progress, session):
     """
-    Retrieves Wikipedia data for a given MeSH code.
+    Finds the English Wikipedia page title of a given MeSH code.
 
     Args:
         mesh (str): The MeSH code to search for.
         meshTree (list): The list representing the MeSH tree structure.
-        pbar: Progress bar for displaying progress.
-        wikiProgressLabel: Label for displaying progress.
-        french_or_english: Flag indicating whether to fetch French (1) or English (0) content.
+        progress (ProgressTracker): The progress of the run.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
 
     Returns:
-        tuple: A tuple containing the link, MeSH code, UI, title, and content if successful.
-        bool: False if the data could not be retrieved.
-    """
-    global nb_tasks
-    global nb_tasks_done
-    global failed_tasks
-    global successed_tasks
-    main_code = mesh[:3]
-    url = f"https://en.wikipedia.org/wiki/List_of_MeSH_codes_({main_code})"
-    response = await fetch(url)
-    soup = BeautifulSoup(response, 'html.parser')    
-    div = soup.find('div', {'class': 'mw-parser-output'})
-    ui = None
-    en_link = None
-    for li in div.find_all('li') + div.find_all('h3'):
-        if (mesh + " ") in li.text:
-            li_elements = li.find_all('li')
-            if not li_elements:
-                all_a = li.find_all('a')
-                if len(all_a) < 3:
-                    print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
-                    nb_tasks_done += 1
-                    failed_tasks += 1
-                    pbar.setValue(int(nb_tasks_done/nb_tasks*100))
-                    wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-                    QApplication.processEvents()
-                    return False
-                second_a_tag = all_a[2]
-                en_link = "https://en.wikipedia.org" + second_a_tag['href']
+        tuple: A tuple containing the English page title, the MeSH codes and the UI if successful.
+        bool: False if no page was found.
+    """
+    index = await get_mesh_code_index(mesh[:3], session)
+    en_link = index.get(mesh)
 
     if en_link is None:
-        print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
-        nb_tasks_done += 1
-        failed_tasks += 1
-        pbar.setValue(int(nb_tasks_done / nb_tasks * 100))
-        wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-        QApplication.processEvents()
-        return False
-    
-    if french_or_english == 1 :
-        link = await wiki.get_french_link(en_link)
-        if link==None:
-            print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
-            nb_tasks_done += 1
-            failed_tasks += 1
-            pbar.setValue(int(nb_tasks_done/nb_tasks*100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
-            return False
-        response = await fetch(link)
-    if french_or_english == 0 :
-        response = await fetch(en_link)
-    soup = BeautifulSoup(response, 'html.parser')
-    span_tag = soup.find('span', class_='mw-page-title-main')
-    title = None
+        return no_page_found(mesh, progress)
+
     ui = MeshToUniqueID(mesh, meshTree)[0]
-    mesh = UniqueIDToMesh(ui, meshTree)
-    mesh = ';'.join(mesh)
-    if span_tag:
-        title = span_tag.string.strip()
-    if title:
-        wiki_content = await wiki.get_content_from_title_via_api(title,french_or_english)
+    meshs = ';'.join(UniqueIDToMesh(ui, meshTree))
+    return wiki.link_to_title(en_link), meshs, ui
+
+async def get_wiki_data_batch(found, progress, french_or_english, session):
+    """
+    Retrieves the contents of a batch of Wikipedia pages with one batched API query.
+
+    Args:
+        found (list): (MeSH code, (title, MeSH codes, UI)) pairs of the pages, at most wiki.API_TITLES_LIMIT.
+        progress (ProgressTracker): The progress of the run.
+        french_or_english: Flag indicating whether to fetch French (1) or English (0) content.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
+
+    Returns:
+        list: Tuples containing the link, MeSH codes, UI, title, and content of each page retrieved.
+    """
+    contents = await wiki.get_contents_from_titles_via_api([title for _, (title, _, _) in found], french_or_english, session)
+    results = []
+    for mesh, (title, codes, ui) in found:
+        wiki_content = contents[title]
         if wiki_content != (None, None, None):
             title, link, content = wiki_content
-            nb_tasks_done += 1
-            successed_tasks += 1
-            pbar.setValue(int(nb_tasks_done/nb_tasks*100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
-            return link, mesh, ui, title, content
+            progress.advance(done=1)
+            results.append((link, codes, ui, title, content))
         else:
-            print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
-            nb_tasks_done += 1
-            failed_tasks += 1
-            pbar.setValue(int(nb_tasks_done/nb_tasks*100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
-            return False
-    else:
-        print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au code meSH : {bold}{mesh}{end}")
-        nb_tasks_done += 1
-        failed_tasks +=1
-        pbar.setValue(int(nb_tasks_done/nb_tasks*100))
-        wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-        QApplication.processEvents()
-        return False         
-
-async def launch(topic, depth, filename, openType, meshTree, pbar, wikiProgressLabel, french , english):
+            no_page_found(mesh, progress)
+    return results
+
+async def save_wiki_data_mesh_codes(meshs, meshTree, progress, french_or_english, known_urls, session, filename, openType, sink='csv'):
+    """
+    Retrieves Wikipedia data for several MeSH codes in one language and saves each
+    batch of pages as soon as it arrives.
+
+    The English titles come from the "List_of_MeSH_codes" indexes, the French
+    ones from batched langlinks queries, and all the contents are retrieved
+    with batched extracts queries.
+
+    Args:
+        meshs (list): The MeSH codes to search for.
+        meshTree (list): The list representing the MeSH tree structure.
+        progress (ProgressTracker): The progress of the run.
+        french_or_english: Flag indicating whether to fetch French (1) or English (0) content.
+        known_urls (KnownUrls): The URLs already saved in the output file of the language.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
+        filename (str): The name of the output CSV file.
+        openType (str): The mode in which the file is opened.
+        sink (str): The output format, e.g. 'csv' or 'parquet'.
+    """
+    async with wiki.language_file(filename, french_or_english, openType, sink) as writer:
+        pages = await asyncio.gather(*[get_wiki_title_mesh_code(mesh, meshTree, progress, session) for mesh in meshs])
+        found = [(mesh, page) for mesh, page in zip(meshs, pages) if page]
+        if french_or_english == 1:
+            french_titles = await wiki.get_french_titles([title for _, (title, _, _) in found], session)
+            translated = []
+            for mesh, (title, codes, ui) in found:
+                if french_titles[title] is None:
+                    no_page_found(mesh, progress)
+                else:
+                    translated.append((mesh, (french_titles[title], codes, ui)))
+            found = translated
+        found = [(mesh, page) for mesh, page in found if not wiki.skip_known_page(page[0], known_urls, progress, french_or_english)]
+        batches = [found[i:i + wiki.API_TITLES_LIMIT] for i in range(0, len(found), wiki.API_TITLES_LIMIT)]
+        await wiki.save_results_as_completed([get_wiki_data_batch(batch, progress, french_or_english, session) for batch in batches], filename, writer)
+
+async def launch(topic, depth, filename, openType, meshTree, pbar, wikiProgressLabel, french , english, session=None, sink='csv'):
     """
     Launches the process to retrieve Wikipedia data for MeSH codes related to a topic.
 
@@ -147,40 +227,23 @@ async def launch(topic, depth, filename, openType, meshTree, pbar, wikiProgressL
         wikiProgressLabel: Label for displaying progress.
         french: Flag indicating whether to fetch French content.
         english: Flag indicating whether to fetch English content.
+        session (aiohttp.ClientSession): The shared Wikipedia session, created for the run if not given.
+        sink (str): The output format, e.g. 'csv' or 'parquet'.
     """
-    global nb_tasks
-    global nb_tasks_done
-    global failed_tasks
-    global successed_tasks
-    nb_tasks_done = 0
-    failed_tasks = 0
-    successed_tasks = 0
+    if session is None:
+        async with wiki.create_session() as session:
+            return await launch(topic, depth, filename, openType, meshTree, pbar, wikiProgressLabel, french, english, session, sink)
     meshs = depthMeshCode(topic, depth, meshTree)
-    french_tasks = []
-    english_tasks = []
-    for mesh in meshs:
-        if french:
-            french_tasks.append(get_wiki_data_mesh_code(mesh, meshTree, pbar, wikiProgressLabel, 1))
-        if english:
-            english_tasks.append(get_wiki_data_mesh_code(mesh, meshTree, pbar, wikiProgressLabel, 0))
-    nb_tasks = len(french_tasks)+len(english_tasks)
-    english_results = await asyncio.gather(*english_tasks)
-    french_results = await asyncio.gather(*french_tasks)
-    if not os.path.exists('wikipedia/wiki_data'):
-        # Create the directory if not existing
-        os.makedirs('wikipedia/wiki_data')
-    if english_results != []:
-        async with aiofiles.open("wikipedia/wiki_data/" + filename + "_en.csv", openType, newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile, delimiter='|')
-            for wiki_data in english_results:
-                if wiki_data:
-                    link, mesh, UI, title, content = wiki_data
-                    await wiki.save_to_csv(link, mesh, UI, title, content, filename, writer)
-    if french_results != []:
-        async with aiofiles.open("wikipedia/wiki_data/" + filename + "_fr.csv", openType, newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile, delimiter='|')
-            for wiki_data in french_results:
-                if wiki_data:
-                    link, mesh, UI, title, content = wiki_data
-                    await wiki.save_to_csv(link, mesh, UI, title, content, filename, writer)
+    french_known_urls = load_known_urls(sink, wiki.language_path(filename, 1), openType)
+    english_known_urls = load_known_urls(sink, wiki.language_path(filename, 0), openType)
+    progress = ProgressTracker('WIKIPEDIA', len(meshs) * (int(french) + int(english)))
+    languages = []
+    if english:
+        languages.append(save_wiki_data_mesh_codes(meshs, meshTree, progress, 0, english_known_urls, session, filename, openType, sink))
+    if french:
+        languages.append(save_wiki_data_mesh_codes(meshs, meshTree, progress, 1, french_known_urls, session, filename, openType, sink))
+    async with ProgressReporter(progress, pbar, wikiProgressLabel):
+        await asyncio.gather(*languages)
+    if progress.skipped > 0:
+        print(f"{bold}{underline}WIKIPEDIA :{end} {progress.skipped} page(s) already saved in {bold}{filename}{end} skipped.")
     return False
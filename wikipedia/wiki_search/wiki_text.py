@@ -1,11 +1,8 @@
-import csv
-import os
-import aiofiles
-import aiohttp
 import asyncio
 import wikipedia.wiki_search.wiki as wiki
+from common.output_sink import load_known_urls
+from common.progress import ProgressTracker, ProgressReporter
 from MeSH.meshData_func import titleToMesh, titleToUniqueID, englishToFrench, frenchToEnglish
-from PyQt5.QtWidgets import QApplication
 
 # Constants for styling console output
 bold = '\033[1m'
@@ -13,89 +10,53 @@ end = '\033[0m'
 underline = '\033[4m'
 red = '\033[91m'
 
-# Global counters for task progress tracking
-nb_tasks = 0
-nb_tasks_done = 0
-successed_tasks = 0
-failed_tasks = 0
-
-async def fetch(url, params):
-    """
-    Fetches the content of a given URL asynchronously with parameters.
-
-    Args:
-        url (str): The URL to fetch.
-        params (dict): The parameters for the GET request.
-
-    Returns:
-        dict: The JSON content of the response.
-    """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as response:
-            return await response.json()
-
-async def get_wiki_data_title(title, meshTree, pbar, wikiProgressLabel, french_or_english):
+async def get_wiki_data_title(title, meshTree, progress, french_or_english, known_urls, session):
     """
     Retrieves Wikipedia data for a given title.
 
     Args:
         title (str): The title to search for.
         meshTree (list): The list representing the MeSH tree structure.
-        pbar: Progress bar for displaying progress.
-        wikiProgressLabel: Label for displaying progress.
+        progress (ProgressTracker): The progress of the run.
         french_or_english: Flag indicating whether to fetch French (1) or English (0) content.
+        known_urls (KnownUrls): The URLs already saved in the output file of the language.
+        session (aiohttp.ClientSession): The shared Wikipedia session.
 
     Returns:
         tuple: A tuple containing the link, MeSH code, UI, title, and content if successful.
         bool: False if the data could not be retrieved.
     """
-    global nb_tasks
-    global nb_tasks_done
-    global failed_tasks
-    global successed_tasks
     mesh = titleToMesh([frenchToEnglish(title, meshTree)],meshTree)
     mesh = ';'.join(mesh)
     UI = titleToUniqueID([frenchToEnglish(title,meshTree)],meshTree)[0]
     if french_or_english == 1 :
-        fr_title = englishToFrench(title, meshTree)
-        wiki_content = await wiki.get_content_from_title_via_api(fr_title.lower(), 1)
+        fr_title = englishToFrench(title, meshTree).lower()
+        if wiki.skip_known_page(fr_title, known_urls, progress, 1):
+            return False
+        wiki_content = await wiki.get_content_from_title_via_api(fr_title, 1, session)
         if wiki_content != (None, None, None):
-            nb_tasks_done += 1
-            successed_tasks += 1
-            pbar.setValue(int(nb_tasks_done / nb_tasks * 100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
+            progress.advance(done=1)
             title, link, content = wiki_content
             return link, mesh, UI, title, content
         else:
-            nb_tasks_done += 1
-            failed_tasks += 1
-            pbar.setValue(int(nb_tasks_done / nb_tasks * 100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
+            progress.advance(failed=1)
             print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au titre : {bold}{fr_title}{end}")
             return False
     if french_or_english == 0:
-        en_title = frenchToEnglish(title, meshTree)
-        wiki_content = await wiki.get_content_from_title_via_api(en_title.lower(), 0)
+        en_title = frenchToEnglish(title, meshTree).lower()
+        if wiki.skip_known_page(en_title, known_urls, progress, 0):
+            return False
+        wiki_content = await wiki.get_content_from_title_via_api(en_title, 0, session)
         if wiki_content != (None, None, None):
-            nb_tasks_done += 1
-            successed_tasks += 1
-            pbar.setValue(int(nb_tasks_done / nb_tasks * 100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
+            progress.advance(done=1)
             title, link, content = wiki_content
             return link, mesh, UI, title, content
         else:
-            nb_tasks_done += 1
-            failed_tasks += 1
-            pbar.setValue(int(nb_tasks_done / nb_tasks * 100))
-            wikiProgressLabel.setText(f"WIKIPEDIA {int(nb_tasks_done/nb_tasks*100)}% [Failed : {failed_tasks} Done : {successed_tasks}] {nb_tasks_done} / {nb_tasks}")
-            QApplication.processEvents()
+            progress.advance(failed=1)
             print(f"{red}{bold}{underline}WIKIPEDIA :{end}{red}{bold} Error :{end}{red} Pas de page Wikipédia correspondant au titre : {bold}{en_title}{end}")
             return False
 
-async def launch(topic, filename, openType, meshTree, pbar, wikiProgressLabel, french, english):
+async def launch(topic, filename, openType, meshTree, pbar, wikiProgressLabel, french, english, session=None, sink='csv'):
     """
     Launches the process to retrieve Wikipedia data for a given topic.
 
@@ -108,38 +69,22 @@ async def launch(topic, filename, openType, meshTree, pbar, wikiProgressLabel, f
         wikiProgressLabel: Label for displaying progress.
         french: Flag indicating whether to fetch French content.
         english: Flag indicating whether to fetch English content.
+        session (aiohttp.ClientSession): The shared Wikipedia session, created for the run if not given.
+        sink (str): The output format, e.g. 'csv' or 'parquet'.
     """
-    global nb_tasks
-    global nb_tasks_done
-    global failed_tasks
-    global successed_tasks
-    failed_tasks = 0
-    successed_tasks = 0
-    nb_tasks_done = 0
-    french_tasks = []
-    english_tasks = []
+    if session is None:
+        async with wiki.create_session() as session:
+            return await launch(topic, filename, openType, meshTree, pbar, wikiProgressLabel, french, english, session, sink)
+    french_known_urls = load_known_urls(sink, wiki.language_path(filename, 1), openType)
+    english_known_urls = load_known_urls(sink, wiki.language_path(filename, 0), openType)
+    progress = ProgressTracker('WIKIPEDIA', int(french) + int(english))
+    languages = []
     if french:
-        french_tasks.append(get_wiki_data_title(topic, meshTree, pbar, wikiProgressLabel, 1))
+        languages.append(wiki.save_language(get_wiki_data_title(topic, meshTree, progress, 1, french_known_urls, session), filename, openType, 1, sink))
     if english:
-        english_tasks.append(get_wiki_data_title(topic, meshTree, pbar, wikiProgressLabel, 0))
-    nb_tasks = len(french_tasks)+len(english_tasks)
-    english_results = await asyncio.gather(*english_tasks)
-    french_results = await asyncio.gather(*french_tasks)
-    if not os.path.exists('wikipedia/wiki_data'):
-        # Create the directory if not existing
-        os.makedirs('wikipedia/wiki_data')
-    if english_results != []:
-        async with aiofiles.open("wikipedia/wiki_data/" + filename + "_en.csv", openType, newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile, delimiter='|')
-            for wiki_data in english_results:
-                if wiki_data:
-                    link, mesh, UI, title, content = wiki_data
-                    await wiki.save_to_csv(link, mesh, UI, title, content, filename, writer)
-    if french_results != []:
-        async with aiofiles.open("wikipedia/wiki_data/" + filename + "_fr.csv", openType, newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile, delimiter='|')
-            for wiki_data in french_results:
-                if wiki_data:
-                    link, mesh, UI, title, content = wiki_data
-                    await wiki.save_to_csv(link, mesh, UI, title, content, filename, writer)
+        languages.append(wiki.save_language(get_wiki_data_title(topic, meshTree, progress, 0, english_known_urls, session), filename, openType, 0, sink))
+    async with ProgressReporter(progress, pbar, wikiProgressLabel):
+        await asyncio.gather(*languages)
+    if progress.skipped > 0:
+        print(f"{bold}{underline}WIKIPEDIA :{end} {progress.skipped} page(s) already saved in {bold}{filename}{end} skipped.")
     return False